@@ -1,12 +1,15 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 from django.http import HttpResponseRedirect
 from django.shortcuts import reverse
 from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
-from .models import (Order, OrderItem, Product, ProductCategory, Restaurant,
-                     RestaurantMenuItem)
+from .models import (ArchivedOrder, ArchivedOrderItem, Order, OrderItem,
+                     Product, ProductCategory, Restaurant, RestaurantMenuItem)
+from .paginators import EstimatedCountPaginator
+from .thumbnails import get_thumbnail_url
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -30,6 +33,8 @@ class RestaurantAdmin(admin.ModelAdmin):
         'name',
         'address',
         'contact_phone',
+        'delivery_radius',
+        'capacity',
     ]
     inlines = [
         RestaurantMenuItemInline
@@ -95,7 +100,7 @@ class ProductAdmin(admin.ModelAdmin):
             return 'выберите картинку'
         return format_html(
             '<img src="{url}" style="max-height: 200px;"/>',
-            url=obj.image.url
+            url=get_thumbnail_url(obj, 320)
         )
     get_image_preview.short_description = 'превью'
 
@@ -106,7 +111,7 @@ class ProductAdmin(admin.ModelAdmin):
         return format_html(
             '<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>',
             edit_url=edit_url,
-            src=obj.image.url
+            src=get_thumbnail_url(obj, 100)
         )
     get_image_list_preview.short_description = 'превью'
 
@@ -118,6 +123,15 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = [
+        'assigned_restaurant',
+    ]
+    list_filter = [
+        'status',
+        'assigned_restaurant',
+    ]
     list_display = [
         'status',
         'firstname',
@@ -131,15 +145,29 @@ class OrderAdmin(admin.ModelAdmin):
     ]
     readonly_fields = [
         'date_registration',
+        'total_price',
     ]
     inlines = [
         OrderItemInline
     ]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch(
+                'order_items',
+                queryset=OrderItem.objects.select_related('product').only(
+                    'id', 'order_id', 'quantity', 'product__name'),
+            )
+        )
+
     def items_list(self, obj):
         return ", ".join([str(item) for item in obj.order_items.all()])
     items_list.short_description = 'Items'
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Order.objects.filter(id=form.instance.id).refresh_candidate_restaurants()
+
     def response_change(self, request, obj):
         response = super().response_change(request, obj)
         next_url = request.GET.get("next")
@@ -155,3 +183,52 @@ class OrderAdmin(admin.ModelAdmin):
             return HttpResponseRedirect(next_url)
 
         return response
+
+
+class ReadOnlyAdminMixin:
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedOrderItemInline(ReadOnlyAdminMixin, admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = [
+        'assigned_restaurant',
+    ]
+    list_display = [
+        'id',
+        'firstname',
+        'lastname',
+        'phonenumber',
+        'address',
+        'assigned_restaurant',
+        'total_price',
+        'date_registration',
+        'delivered_at',
+    ]
+    list_filter = [
+        'assigned_restaurant',
+    ]
+    search_fields = [
+        '=id',
+        'lastname',
+        '=phonenumber',
+        'address',
+    ]
+    date_hierarchy = 'date_registration'
+    inlines = [
+        ArchivedOrderItemInline
+    ]
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVED_ORDER_FIELDS = [
+    'id', 'payment_method', 'status', 'firstname', 'lastname', 'phonenumber',
+    'address', 'latitude', 'longitude', 'date_registration', 'called_at',
+    'delivered_at', 'assigned_restaurant_id', 'comment', 'total_price',
+]
+ARCHIVED_ITEM_FIELDS = ['order_id', 'product_id', 'quantity', 'price']
+
+
+def get_archivable_orders(days):
+    """Выполненные заказы, доставленные больше `days` дней назад.
+
+    У старых заказов `delivered_at` бывает пустым, тогда смотрим
+    на дату регистрации.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return Order.objects.filter(status='DONE').filter(
+        Q(delivered_at__lt=cutoff)
+        | Q(delivered_at__isnull=True, date_registration__lt=cutoff)
+    )
+
+
+def delete_rows(model, field_name, values):
+    """Удаляет строки `model`, у которых `field_name` из `values`, сырыми DELETE.
+
+    В обход `QuerySet.delete()`: тот перед удалением выбирает строки,
+    чтобы разослать `post_delete` и пройти по связям. Здесь ни сигналов,
+    ни каскадов нет, поэтому зависимые строки вызывающий код удаляет
+    сам, а отметки `DeletedOrder` не появляются — звать только там, где
+    они не нужны. Значения режутся на пачки по `bulk_batch_size`, чтобы
+    не упереться в лимит параметров запроса, у старых SQLite это 999.
+    Возвращает число удалённых строк.
+    """
+    values = list(values)
+    connection = connections[router.db_for_write(model)]
+    field = model._meta.get_field(field_name)
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(field.column)
+    batch_size = connection.ops.bulk_batch_size([field], values)
+    deleted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', batch)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def archive_batch(orders, batch_size):
+    """Переносит в архив до `batch_size` заказов из `orders` вместе с позициями.
+
+    Всё делается в одной транзакции: если процесс упадёт посередине,
+    пачка откатится целиком и при следующем запуске будет перенесена
+    заново. Возвращает число перенесённых заказов.
+    """
+    with transaction.atomic():
+        batch = list(
+            orders
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values(*ARCHIVED_ORDER_FIELDS)[:batch_size]
+        )
+        if not batch:
+            return 0
+        order_ids = [order['id'] for order in batch]
+        items = OrderItem.objects.filter(order_id__in=order_ids).values(*ARCHIVED_ITEM_FIELDS)
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in batch])
+        ArchivedOrderItem.objects.bulk_create(
+            [ArchivedOrderItem(**item) for item in items],
+        )
+        # Без сигналов post_delete: сумма заказа уже посчитана, а сам
+        # заказ сейчас исчезнет, пересчитывать её по каждой позиции незачем.
+        # Отметки DeletedOrder тоже не нужны: выполненные заказы ушли
+        # с доски менеджера, когда сменили статус, а сводка продаж
+        # считает живые и архивные заказы вместе, так что итог дня
+        # от переноса не меняется
+        delete_rows(OrderItem, 'order', order_ids)
+        delete_rows(Order, 'id', order_ids)
+    return len(batch)
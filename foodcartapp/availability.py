@@ -0,0 +1,49 @@
+from django.db import transaction
+
+from .models import RestaurantMenuItem
+from .signals import menu_changed
+
+
+def set_menu_availability(changes):
+    """Применяет пачку отметок «в продаже» одной транзакцией.
+
+    `changes` — словари с ключами `restaurant`, `product` и `availability`.
+    Существующие пункты меню обновляются одним `bulk_update`, недостающие
+    создаются, если товар включают в продажу. Кэши сбрасывает один сигнал
+    `menu_changed` после коммита, а не `post_save` по каждой строке.
+    Возвращает число изменённых пунктов меню.
+    """
+    wanted = {
+        (change['restaurant'], change['product']): change['availability']
+        for change in changes
+    }
+    with transaction.atomic():
+        items = RestaurantMenuItem.objects.select_for_update().filter(
+            restaurant_id__in={restaurant_id for restaurant_id, _ in wanted},
+            product_id__in={product_id for _, product_id in wanted},
+        )
+        changed = []
+        for item in items:
+            key = (item.restaurant_id, item.product_id)
+            if key not in wanted:
+                continue
+            availability = wanted.pop(key)
+            if item.availability != availability:
+                item.availability = availability
+                changed.append(item)
+        RestaurantMenuItem.objects.bulk_update(changed, ['availability'], batch_size=500)
+
+        created = [
+            RestaurantMenuItem(restaurant_id=restaurant_id, product_id=product_id)
+            for (restaurant_id, product_id), availability in wanted.items()
+            if availability
+        ]
+        # С ignore_conflicts=True Django не возвращает id созданных строк ни на
+        # одной базе, так что индекс меню обновит их по ресторану и товару
+        RestaurantMenuItem.objects.bulk_create(created, batch_size=500, ignore_conflicts=True)
+
+        items = changed + created
+        if items:
+            transaction.on_commit(
+                lambda: menu_changed.send(sender=RestaurantMenuItem, items=items))
+    return len(items)
@@ -0,0 +1,106 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.test import AsyncClient, Client
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def latency_summary(latencies, elapsed=None):
+    summary = {
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': max(latencies, default=None),
+    }
+    if elapsed:
+        summary['rps'] = len(latencies) / elapsed
+    return summary
+
+
+def format_summary(name, summary):
+    fields = ', '.join(
+        f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}'
+        for key, value in summary.items()
+    )
+    return f'{name}: {fields}'
+
+
+def get_test_host():
+    return next(
+        (host for host in settings.ALLOWED_HOSTS if host not in ('*', '') and not host.startswith('.')),
+        'localhost',
+    )
+
+
+def test_client(**defaults):
+    return Client(HTTP_HOST=get_test_host(), **defaults)
+
+
+def async_test_client(**defaults):
+    """`AsyncClient` в Django 3.2 всегда шлёт `Host: testserver`, поэтому
+    прогон через него нужно обернуть в `override_settings` с этим хостом
+    в `ALLOWED_HOSTS`."""
+    return AsyncClient(**defaults)
+
+
+def run_load(call, total, concurrency):
+    """Вызывает `call(number)` `total` раз в `concurrency` потоков.
+
+    Возвращает задержки вызовов в миллисекундах и общее время прогона
+    в секундах.
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(number):
+        started_at = time.perf_counter()
+        try:
+            call(number)
+        finally:
+            latency = (time.perf_counter() - started_at) * 1000
+            with lock:
+                latencies.append(latency)
+
+    started_at = time.perf_counter()
+    if concurrency == 1:
+        for number in range(total):
+            timed(number)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, range(total)))
+    return latencies, time.perf_counter() - started_at
+
+
+def run_async_load(call, total, concurrency):
+    """Как `run_load`, но `call(number)` — корутина, и вызовы идут
+    в одном event loop, не больше `concurrency` одновременно.
+    """
+    latencies = []
+
+    async def timed(number, semaphore):
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                await call(number)
+            finally:
+                latencies.append((time.perf_counter() - started_at) * 1000)
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(timed(number, semaphore) for number in range(total)))
+
+    started_at = time.perf_counter()
+    asyncio.run(run())
+    return latencies, time.perf_counter() - started_at
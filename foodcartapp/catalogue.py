@@ -0,0 +1,84 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from .models import Product
+from .thumbnails import THUMBNAIL_FORMATS, get_srcset
+
+CATALOGUE_CACHE_KEY = 'foodcartapp:catalogue'
+
+
+def serialize_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'image_srcset': {
+            image_format: get_srcset(product, image_format)
+            for image_format in THUMBNAIL_FORMATS
+        },
+        'restaurant': {
+            'id': product.id,
+            'name': product.name,
+        }
+    }
+
+
+def render_catalogue():
+    products = Product.objects.select_related('category').available()
+    body = JSONRenderer().render([serialize_product(product) for product in products])
+    return hashlib.md5(body).hexdigest(), body
+
+
+def get_catalogue():
+    """Возвращает пару (ETag, JSON) каталога, собирая его только при промахе кэша."""
+    catalogue = cache.get(CATALOGUE_CACHE_KEY)
+    if catalogue is None:
+        catalogue = render_catalogue()
+        cache.set(CATALOGUE_CACHE_KEY, catalogue, settings.CATALOGUE_CACHE_TIMEOUT)
+    return catalogue
+
+
+def invalidate_catalogue():
+    cache.delete(CATALOGUE_CACHE_KEY)
+
+
+def filter_products(category=None, restaurant=None, special_status=None, after_id=None):
+    products = (
+        Product.objects
+        .select_related('category')
+        .available()
+        .order_by('id')
+    )
+    if category is not None:
+        products = products.filter(category_id=category)
+    if restaurant is not None:
+        products = products.filter(
+            menu_items__restaurant_id=restaurant,
+            menu_items__availability=True,
+        )
+    if special_status is not None:
+        products = products.filter(special_status=special_status)
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+    return products
+
+
+def stream_catalogue(products, chunk_size=500):
+    """Отдаёт JSON-массив товаров кусками по мере чтения из курсора."""
+    renderer = JSONRenderer()
+    yield b'['
+    for number, product in enumerate(products.iterator(chunk_size=chunk_size)):
+        if number:
+            yield b','
+        yield renderer.render(serialize_product(product))
+    yield b']'
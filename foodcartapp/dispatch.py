@@ -0,0 +1,149 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Order, Restaurant
+
+
+def assign_orders(candidates, capacities, repair_depth=10):
+    """Распределяет заказы по ресторанам, стараясь сократить суммарный путь.
+
+    `candidates` — словарь id заказа → список пар (id ресторана,
+    расстояние в км), `capacities` — сколько ещё заказов может взять
+    каждый ресторан. Сначала жадно раздаём пары «заказ — ресторан» от самых
+    коротких, потом чиним: заказ, которому не хватило места, забирает
+    ресторан у другого заказа, если тот может переехать в ресторан со
+    свободным местом. Для починки смотрим только `repair_depth` ближайших
+    ресторанов каждого заказа.
+
+    Возвращает словарь id заказа → id ресторана.
+    """
+    order_ids = []
+    restaurant_ids = []
+    distances = []
+    for order_id, order_candidates in candidates.items():
+        for restaurant_id, distance in order_candidates:
+            if distance is None or capacities.get(restaurant_id, 0) <= 0:
+                continue
+            order_ids.append(order_id)
+            restaurant_ids.append(restaurant_id)
+            distances.append(distance)
+
+    remaining = dict(capacities)
+    assignment = {}
+    orders_by_restaurant = {}
+    for edge in np.argsort(np.array(distances, dtype=float), kind='stable'):
+        order_id = order_ids[edge]
+        restaurant_id = restaurant_ids[edge]
+        if order_id in assignment or remaining[restaurant_id] <= 0:
+            continue
+        assignment[order_id] = restaurant_id
+        remaining[restaurant_id] -= 1
+        orders_by_restaurant.setdefault(restaurant_id, set()).add(order_id)
+
+    nearest = {
+        order_id: sorted(
+            (
+                (restaurant_id, distance)
+                for restaurant_id, distance in order_candidates
+                if distance is not None and restaurant_id in capacities
+            ),
+            key=lambda candidate: candidate[1],
+        )[:repair_depth]
+        for order_id, order_candidates in candidates.items()
+    }
+    distance_to = {
+        order_id: dict(order_candidates)
+        for order_id, order_candidates in nearest.items()
+    }
+
+    for order_id in candidates.keys() - assignment.keys():
+        best_move = None
+        for restaurant_id, distance in nearest[order_id]:
+            for moved_order_id in orders_by_restaurant.get(restaurant_id, ()):
+                current_distance = distance_to[moved_order_id].get(restaurant_id)
+                if current_distance is None:
+                    continue
+                for new_restaurant_id, new_distance in nearest[moved_order_id]:
+                    if remaining[new_restaurant_id] <= 0:
+                        continue
+                    cost = distance + new_distance - current_distance
+                    if best_move is None or cost < best_move[0]:
+                        best_move = (cost, restaurant_id, moved_order_id, new_restaurant_id)
+        if best_move is None:
+            continue
+
+        _, restaurant_id, moved_order_id, new_restaurant_id = best_move
+        orders_by_restaurant[restaurant_id].remove(moved_order_id)
+        orders_by_restaurant[restaurant_id].add(order_id)
+        orders_by_restaurant.setdefault(new_restaurant_id, set()).add(moved_order_id)
+        remaining[new_restaurant_id] -= 1
+        assignment[order_id] = restaurant_id
+        assignment[moved_order_id] = new_restaurant_id
+
+    return assignment
+
+
+def total_distance(candidates, assignment):
+    return sum(
+        dict(candidates[order_id])[restaurant_id]
+        for order_id, restaurant_id in assignment.items()
+    )
+
+
+def get_free_capacities():
+    busy = dict(
+        Order.objects
+        .exclude(status='DONE')
+        .filter(assigned_restaurant__isnull=False)
+        .values_list('assigned_restaurant')
+        .annotate(orders_count=Count('id'))
+    )
+    return {
+        restaurant_id: capacity - busy.get(restaurant_id, 0)
+        for restaurant_id, capacity in Restaurant.objects.values_list('id', 'capacity')
+    }
+
+
+def dispatch_new_orders(dry_run=False):
+    """Назначает рестораны всем новым заказам без ресторана.
+
+    Подходящие рестораны и расстояния берутся из
+    `Order.candidate_restaurants`, свободные места — из `Restaurant.capacity`
+    за вычетом незавершённых заказов. Результат пишется одним
+    `bulk_update`. Возвращает пару (назначения, суммарное расстояние в км).
+    """
+    unassigned = Order.objects.filter(
+        status='NEW',
+        assigned_restaurant__isnull=True,
+    )
+    unassigned.filter(candidate_restaurants__isnull=True).refresh_candidate_restaurants()
+
+    with transaction.atomic():
+        orders = list(
+            unassigned
+            .select_for_update(skip_locked=True)
+            .only('id', 'candidate_restaurants')
+        )
+        candidates = {
+            order.id: [
+                (candidate['restaurant_id'], candidate['distance'])
+                for candidate in order.candidate_restaurants or []
+            ]
+            for order in orders
+        }
+        assignment = assign_orders(candidates, get_free_capacities())
+
+        now = timezone.now()
+        assigned_orders = []
+        for order in orders:
+            if order.id in assignment:
+                order.assigned_restaurant_id = assignment[order.id]
+                order.updated_at = now
+                assigned_orders.append(order)
+        if not dry_run:
+            Order.objects.bulk_update(
+                assigned_orders, ['assigned_restaurant', 'updated_at'], batch_size=1000)
+
+    return assignment, total_distance(candidates, assignment)
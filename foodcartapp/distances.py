@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from geopy.distance import geodesic
+
+EARTH_RADIUS_KM = 6371.0088
+
+HAVERSINE = 'haversine'
+GEODESIC = 'geodesic'
+DISTANCE_MODES = (HAVERSINE, GEODESIC)
+
+RestaurantDistance = namedtuple(
+    'RestaurantDistance', ['restaurant_id', 'name', 'distance'])
+
+
+def to_points(objects):
+    """Собирает массив (n, 2) из широт и долгот, NaN для пустых координат."""
+    points = np.full((len(objects), 2), np.nan)
+    for index, obj in enumerate(objects):
+        if obj.latitude is not None and obj.longitude is not None:
+            points[index] = float(obj.latitude), float(obj.longitude)
+    return points
+
+
+def haversine_matrix(origins, destinations):
+    lat1, lon1 = np.radians(origins).T
+    lat2, lon2 = np.radians(destinations).T
+    dlat = lat2[np.newaxis, :] - lat1[:, np.newaxis]
+    dlon = lon2[np.newaxis, :] - lon1[:, np.newaxis]
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat1)[:, np.newaxis] * np.cos(lat2)[np.newaxis, :]
+        * np.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def geodesic_matrix(origins, destinations):
+    matrix = np.full((len(origins), len(destinations)), np.nan)
+    known_destinations = [
+        (column, tuple(point))
+        for column, point in enumerate(destinations)
+        if not np.isnan(point).any()
+    ]
+    cache = {}
+    for row, origin in enumerate(origins):
+        if np.isnan(origin).any():
+            continue
+        origin = tuple(origin)
+        for column, destination in known_destinations:
+            key = (origin, destination)
+            if key not in cache:
+                cache[key] = geodesic(origin, destination).km
+            matrix[row, column] = cache[key]
+    return matrix
+
+
+def distance_matrix(origins, destinations, mode=None):
+    """Считает расстояния в км между всеми парами точек.
+
+    Режим `haversine` считает всю матрицу одной векторной операцией,
+    `geodesic` даёт точное расстояние по эллипсоиду WGS-84, но медленнее.
+    Для точек без координат в матрице остаётся NaN.
+    """
+    mode = mode or settings.DISTANCE_MODE
+    if mode not in DISTANCE_MODES:
+        raise ValueError(f'Unknown distance mode: {mode}')
+
+    origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+    if mode == GEODESIC:
+        return geodesic_matrix(origins, destinations)
+    return haversine_matrix(origins, destinations)
+
+
+def attach_restaurant_distances(orders, restaurants, mode=None):
+    """Раскладывает по заказам рестораны, отсортированные по удалённости.
+
+    Каждому заказу проставляется `order.restaurants` — список
+    `RestaurantDistance`. Рестораны без координат оказываются в конце
+    списка с расстоянием `None`.
+    """
+    orders = list(orders)
+    restaurants = list(restaurants)
+    matrix = distance_matrix(
+        to_points(orders), to_points(restaurants), mode=mode)
+    order_by_distance = np.argsort(matrix, axis=1, kind='stable')
+
+    for order, distances, ordering in zip(orders, matrix, order_by_distance):
+        order.restaurants = [
+            RestaurantDistance(
+                restaurants[column].id,
+                restaurants[column].name,
+                None if np.isnan(distances[column]) else float(distances[column]),
+            )
+            for column in ordering
+        ]
+    return orders
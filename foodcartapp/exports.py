@@ -0,0 +1,113 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from django.utils import timezone
+
+from .models import ArchivedOrderItem, OrderItem
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+EXPORT_FIELDS = {
+    'order_id': 'order_id',
+    'date_registration': 'order__date_registration',
+    'delivered_at': 'order__delivered_at',
+    'status': 'order__status',
+    'payment_method': 'order__payment_method',
+    'restaurant_id': 'order__assigned_restaurant_id',
+    'restaurant': 'order__assigned_restaurant__name',
+    'firstname': 'order__firstname',
+    'lastname': 'order__lastname',
+    'address': 'order__address',
+    'order_total': 'order__total_price',
+    'product_id': 'product_id',
+    'product': 'product__name',
+    'quantity': 'quantity',
+    'price': 'price',
+}
+
+
+class Echo:
+    """Буфер для `csv.writer`, который просто отдаёт записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def filter_export_items(items, date_from=None, date_to=None, status=None, restaurant=None):
+    if date_from:
+        items = items.filter(
+            order__date_registration__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        items = items.filter(
+            order__date_registration__lt=timezone.make_aware(
+                datetime.combine(date_to + timedelta(days=1), time.min)))
+    if status:
+        items = items.filter(order__status=status)
+    if restaurant:
+        items = items.filter(order__assigned_restaurant=restaurant)
+    return (
+        items
+        .values_list(*EXPORT_FIELDS.values())
+        .order_by('order__date_registration', 'order_id', 'id')
+    )
+
+
+def get_export_items(**filters):
+    """Позиции заказов для выгрузки: сначала архивные, потом рабочие.
+
+    Архив хранит заказы старше рабочих, так что строки идут по дате
+    регистрации. Возвращает два queryset, их читают по очереди.
+    """
+    return [
+        filter_export_items(ArchivedOrderItem.objects.all(), **filters),
+        filter_export_items(OrderItem.objects.all(), **filters),
+    ]
+
+
+def iter_export_rows(querysets, chunk_size=2000):
+    """Строки выгрузки, по одной на позицию заказа.
+
+    Каждый queryset читается курсором на сервере пачками по `chunk_size`
+    строк, так что в памяти одновременно лежит одна пачка, сколько бы
+    строк ни было в выгрузке. Сумма заказа берётся из сохранённого
+    `total_price` и повторяется в каждой его позиции.
+    """
+    return chain.from_iterable(
+        queryset.iterator(chunk_size=chunk_size) for queryset in querysets)
+
+
+def format_value(value, tz):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.astimezone(tz).isoformat()
+    return str(value)
+
+
+def render_csv(rows):
+    tz = timezone.get_current_timezone()
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS.keys())
+    for row in rows:
+        yield writer.writerow([format_value(value, tz) for value in row])
+
+
+def render_ndjson(rows):
+    tz = timezone.get_current_timezone()
+    fields = list(EXPORT_FIELDS)
+    for row in rows:
+        yield json.dumps(
+            dict(zip(fields, row)), ensure_ascii=False,
+            default=lambda value: format_value(value, tz),
+        ) + '\n'
+
+
+def render_export(rows, export_format):
+    if export_format == 'ndjson':
+        return render_ndjson(rows)
+    return render_csv(rows)
@@ -0,0 +1,123 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+NOT_FOUND = 'not-found'
+
+
+def normalize_address(address):
+    """Приводит адрес к ключу кэша: «Москва,  Тверская ул. 1» → «москва тверская ул 1»."""
+    address = address.lower().replace('ё', 'е')
+    address = re.sub(r'[^\w]+', ' ', address)
+    return ' '.join(address.split())
+
+
+class LRUCache:
+    """Ограниченный по размеру LRU-кэш со своим сроком жизни у каждой записи."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class GeocodeCache:
+    """Кэш координат перед таблицей `GeocodeData`.
+
+    Первый уровень — LRU в памяти процесса, второй — необязательный
+    Django-кэш, общий для всех процессов (`GEOCODE_CACHE_ALIAS`).
+    Ненайденные адреса тоже кэшируются, но на меньший срок
+    (`GEOCODE_CACHE_NEGATIVE_TTL`), чтобы не дёргать геокодер заново
+    на каждом заказе с кривым адресом.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(settings.GEOCODE_CACHE_SIZE)
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    @property
+    def shared(self):
+        alias = settings.GEOCODE_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def ttl(coordinates):
+        if coordinates is None:
+            return settings.GEOCODE_CACHE_NEGATIVE_TTL
+        return settings.GEOCODE_CACHE_TTL
+
+    def get(self, key):
+        """Возвращает пару (нашлось ли в кэше, координаты или None)."""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(f'geocode:{key}')
+            if value is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+                self.local.set(key, value, self.ttl(None if value == NOT_FOUND else value))
+        if value is None:
+            return False, None
+        return True, None if value == NOT_FOUND else value
+
+    def set(self, key, coordinates):
+        value = NOT_FOUND if coordinates is None else tuple(coordinates)
+        ttl = self.ttl(coordinates)
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(f'geocode:{key}', value, ttl)
+
+    def stats(self):
+        return {
+            'size': len(self.local),
+            'maxsize': self.local.maxsize,
+            'hits': self.local.hits,
+            'misses': self.local.misses,
+            'evictions': self.local.evictions,
+            'expirations': self.local.expirations,
+            'shared_hits': self.shared_hits,
+            'shared_misses': self.shared_misses,
+        }
+
+
+geocode_cache = GeocodeCache()
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from star_burger.metrics import observe_geocoder_call
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(pool_size=10):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class GeocoderError(Exception):
+    pass
+
+
+class RateLimiter:
+    """Пропускает не больше `rate` вызовов в секунду на все потоки."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next_call_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            call_at = max(now, self._next_call_at)
+            self._next_call_at = call_at + self.interval
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+def fetch_coordinates(address, session=None, rate_limiter=None):
+    """Спрашивает координаты адреса у Яндекс геокодера.
+
+    Возвращает пару `(lat, lon)` строками или `None`, если адрес не нашёлся.
+    Если геокодер не ответил или ответил ерундой, бросает `GeocoderError`.
+    """
+    http = session or requests
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    started_at = time.perf_counter()
+    try:
+        response = http.get(settings.YANDEX_GEOCODER_URL, params={
+            "geocode": address,
+            "apikey": settings.YANDEX_API_KEY,
+            "format": "json",
+        }, timeout=settings.GEOCODER_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        observe_geocoder_call('error', time.perf_counter() - started_at)
+        logger.error(f"Problem with request: {e}")
+        raise GeocoderError(e) from e
+    observe_geocoder_call('ok', time.perf_counter() - started_at)
+
+    try:
+        found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+    except (KeyError, ValueError) as e:
+        logger.error(f"Problem parsing response JSON: {e}")
+        raise GeocoderError(e) from e
+
+    if not found_places:
+        return None
+    try:
+        lon, lat = found_places[0]['GeoObject']['Point']['pos'].split(" ")
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+        logger.error(f"Problem parsing found place: {e!r}")
+        raise GeocoderError(e) from e
+    return lat, lon
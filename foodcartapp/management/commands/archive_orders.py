@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.archive import archive_batch, get_archivable_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит выполненные заказы старше --days дней в архивные таблицы. '
+        'Каждая пачка — отдельная транзакция, так что команду можно прервать '
+        'и запустить снова'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='сколько секунд ждать между пачками, чтобы не нагружать базу',
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='остановиться после стольких пачек',
+        )
+
+    def handle(self, *args, **options):
+        orders = get_archivable_orders(options['days'])
+        started_at = time.perf_counter()
+        archived = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = archive_batch(orders, options['batch_size'])
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(
+                f'Перенесено {archived} заказов за {elapsed:.1f} с '
+                f'({archived / elapsed:.0f} в секунду)'
+            )
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(f'Готово: перенесено {archived} заказов')
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from foodcartapp.benchmarks import format_summary, latency_summary, run_load
+from foodcartapp.catalogue import get_catalogue, serialize_product
+from foodcartapp.models import Product
+from foodcartapp.views import product_list_api
+
+
+@api_view(['GET'])
+def legacy_product_list_api(request):
+    products = Product.objects.select_related('category').available()
+    return Response([serialize_product(product) for product in products])
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность /api/products/ с кэшем и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        etag, _ = get_catalogue()
+
+        runs = [
+            ('legacy', legacy_product_list_api, {}),
+            ('cached', product_list_api, {}),
+            ('cached, If-None-Match', product_list_api, {'HTTP_IF_NONE_MATCH': f'"{etag}"'}),
+        ]
+        for name, view, headers in runs:
+            def call(number):
+                response = view(factory.get('/api/products/', **headers))
+                if hasattr(response, 'render'):
+                    response.render()
+
+            latencies, elapsed = run_load(call, options['requests'], options['workers'])
+            self.stdout.write(format_summary(name, latency_summary(latencies, elapsed)))
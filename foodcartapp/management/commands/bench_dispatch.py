@@ -0,0 +1,54 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import assign_orders, total_distance
+from foodcartapp.distances import haversine_matrix
+
+MOSCOW_CENTER = (55.751244, 37.618423)
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость распределения заказов на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--restaurants', type=int, default=500)
+        parser.add_argument('--capacity', type=int, default=12)
+        parser.add_argument('--radius', type=float, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        spread = np.array([0.3, 0.5])
+        orders = MOSCOW_CENTER + rng.uniform(-1, 1, (options['orders'], 2)) * spread
+        restaurants = MOSCOW_CENTER + rng.uniform(-1, 1, (options['restaurants'], 2)) * spread
+
+        matrix = haversine_matrix(orders, restaurants)
+        candidates = {}
+        for order_id, distances in enumerate(matrix):
+            reachable = np.flatnonzero(distances <= options['radius'])
+            candidates[order_id] = [
+                (int(restaurant_id), float(distances[restaurant_id]))
+                for restaurant_id in reachable
+            ]
+        capacities = {
+            restaurant_id: options['capacity']
+            for restaurant_id in range(options['restaurants'])
+        }
+        edges = sum(len(order_candidates) for order_candidates in candidates.values())
+
+        started_at = time.perf_counter()
+        assignment = assign_orders(candidates, capacities)
+        elapsed = time.perf_counter() - started_at
+
+        greedy_only = assign_orders(candidates, capacities, repair_depth=0)
+        self.stdout.write(
+            f'orders={options["orders"]} restaurants={options["restaurants"]} '
+            f'edges={edges} assigned={len(assignment)} '
+            f'(greedy only {len(greedy_only)}) '
+            f'distance={total_distance(candidates, assignment):.1f}km '
+            f'seconds={elapsed:.3f}'
+        )
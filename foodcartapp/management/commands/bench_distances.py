@@ -0,0 +1,81 @@
+import copy
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from geopy.distance import geodesic
+
+from foodcartapp.distances import GEODESIC, HAVERSINE, attach_restaurant_distances
+from foodcartapp.models import Order, Restaurant
+
+MOSCOW_CENTER = (55.751244, 37.618423)
+
+
+def random_point(rng, spread=0.3):
+    return (
+        round(MOSCOW_CENTER[0] + rng.uniform(-spread, spread), 6),
+        round(MOSCOW_CENTER[1] + rng.uniform(-spread, spread), 6),
+    )
+
+
+def legacy_distances(orders, restaurants):
+    """Прежний алгоритм: geodesic в двойном цикле и deepcopy ресторана."""
+    for order in orders:
+        order_location = (order.latitude, order.longitude)
+        order.restaurants = []
+        for restaurant in restaurants:
+            restaurant_copy = copy.deepcopy(restaurant)
+            restaurant_copy.distance = geodesic(
+                (restaurant.latitude, restaurant.longitude), order_location).km
+            order.restaurants.append(restaurant_copy)
+        order.restaurants.sort(key=lambda r: r.distance)
+    return orders
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость расчёта расстояний от заказов до ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--skip-legacy-above', type=int, default=None,
+            help='не гонять прежний алгоритм на выборках больше N заказов',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        restaurants = []
+        for number in range(options['restaurants']):
+            latitude, longitude = random_point(rng)
+            restaurants.append(Restaurant(
+                id=number + 1, name=f'Ресторан {number + 1}',
+                latitude=latitude, longitude=longitude,
+            ))
+
+        self.stdout.write(f'{"orders":>8} {"mode":>10} {"seconds":>10}')
+        for orders_count in options['orders']:
+            orders = []
+            for number in range(orders_count):
+                latitude, longitude = random_point(rng)
+                orders.append(Order(
+                    id=number + 1, latitude=latitude, longitude=longitude))
+
+            runs = [
+                (HAVERSINE, lambda: attach_restaurant_distances(
+                    orders, restaurants, mode=HAVERSINE)),
+                (GEODESIC, lambda: attach_restaurant_distances(
+                    orders, restaurants, mode=GEODESIC)),
+            ]
+            skip_legacy_above = options['skip_legacy_above']
+            if skip_legacy_above is None or orders_count <= skip_legacy_above:
+                runs.append(
+                    ('legacy', lambda: legacy_distances(orders, restaurants)))
+
+            for mode, run in runs:
+                started_at = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started_at
+                self.stdout.write(f'{orders_count:>8} {mode:>10} {elapsed:>10.4f}')
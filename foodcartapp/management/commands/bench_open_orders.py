@@ -0,0 +1,99 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from foodcartapp.archive import (archive_batch, delete_rows,
+                                 get_archivable_orders)
+from foodcartapp.benchmarks import format_summary, latency_summary
+from foodcartapp.models import ArchivedOrder, Order
+
+BENCH_COMMENT = 'bench_open_orders'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет выборку открытых заказов для страницы менеджера, '
+        'пока история выполненных заказов растёт до --sizes строк'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10 ** 5, 10 ** 6],
+            help='до скольких строк дорастить историю, например 100000 1000000 10000000',
+        )
+        parser.add_argument('--open', type=int, default=500, help='сколько открытых заказов')
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--archive', action='store_true',
+            help='перед замером переносить историю в архив командой archive_orders',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='не удалять созданные строки после прогона',
+        )
+
+    def handle(self, *args, **options):
+        self.create_orders(options['open'], status='NEW', batch_size=options['batch_size'])
+        history = 0
+        try:
+            for size in sorted(options['sizes']):
+                self.create_orders(size - history, status='DONE', batch_size=options['batch_size'])
+                history = size
+                if options['archive']:
+                    orders = get_archivable_orders(days=1).filter(comment=BENCH_COMMENT)
+                    while archive_batch(orders, options['batch_size']):
+                        pass
+                self.analyze()
+
+                latencies = []
+                for _ in range(options['runs']):
+                    started_at = time.perf_counter()
+                    list(
+                        Order.objects.get_not_done_orders_with_total_price()
+                        .select_related('assigned_restaurant')
+                        .order_by('date_registration', 'id')
+                    )
+                    latencies.append((time.perf_counter() - started_at) * 1000)
+
+                summary = latency_summary(latencies)
+                summary['orders_table'] = Order.objects.count()
+                summary['archive_table'] = ArchivedOrder.objects.count()
+                self.stdout.write(format_summary(f'history={size}', summary))
+        finally:
+            if not options['keep']:
+                # У заказов бенчмарка нет позиций, так что хватает DELETE
+                # по комментарию без сигналов и обхода связей. Отметок
+                # DeletedOrder при этом не будет, поэтому бенчмарк гоняют
+                # на отдельной базе, без открытой доски менеджера
+                delete_rows(Order, 'comment', [BENCH_COMMENT])
+                delete_rows(ArchivedOrder, 'comment', [BENCH_COMMENT])
+
+    def create_orders(self, count, status, batch_size):
+        delivered_at = timezone.now() - timedelta(days=30) if status == 'DONE' else None
+        for offset in range(0, count, batch_size):
+            Order.objects.bulk_create([
+                Order(
+                    firstname='Бенч',
+                    lastname='Маркович',
+                    phonenumber='+79001234567',
+                    address='Москва, Бенчмарковая улица, 1',
+                    status=status,
+                    comment=BENCH_COMMENT,
+                    delivered_at=delivered_at,
+                    geocoding_status=Order.GeocodingStatus.FAILED,
+                    candidate_restaurants=[],
+                )
+                for _ in range(min(batch_size, count - offset))
+            ])
+
+    @staticmethod
+    def analyze():
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE foodcartapp_order')
+            elif connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
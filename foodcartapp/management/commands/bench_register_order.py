@@ -0,0 +1,128 @@
+import copy
+import logging
+import logging.config
+import os
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import resolve
+
+from foodcartapp.benchmarks import (async_test_client, format_summary,
+                                    latency_summary, run_async_load, run_load,
+                                    test_client)
+from foodcartapp.models import GeocodeData, Order, Product
+from foodcartapp.stub_geocoder import StubGeocoder
+
+
+def configure_logging(mode):
+    """Настраивает логи для прогона: как в settings, синхронно в файл или никак."""
+    if mode == 'off':
+        logging.disable(logging.CRITICAL)
+        return
+    config = copy.deepcopy(settings.LOGGING)
+    if mode == 'sync':
+        os.makedirs(os.path.dirname(settings.LOG_FILE), exist_ok=True)
+        config['handlers']['file'] = {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': settings.LOG_FILE,
+            'formatter': 'json',
+            'filters': ['request_id'],
+        }
+    logging.config.dictConfig(config)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку POST /api/order/ с заглушкой геокодера. '
+        'Созданные заказы удаляются после прогона'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument(
+            '--geocoder-delay', type=float, default=0.2,
+            help='сколько секунд заглушка геокодера думает над ответом',
+        )
+        parser.add_argument(
+            '--inline-geocoding', action='store_true',
+            help='геокодировать адрес внутри запроса, как было раньше',
+        )
+        parser.add_argument(
+            '--logging', choices=['queue', 'sync', 'off'], default='queue',
+            help=(
+                'queue — логи через очередь, как в settings, sync — запись '
+                'в файл прямо из потока запроса, off — без логов'
+            ),
+        )
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help=(
+                'слать запросы через ASGI-обработчик из одного event loop. '
+                'Асинхронный view включается настройкой ORDER_API_ASYNC'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            Product.objects.available().values_list('id', flat=True)[:3])
+        if not product_ids:
+            raise CommandError('В базе нет товаров в продаже')
+
+        inline_geocoding = options['inline_geocoding']
+        if inline_geocoding and options['asgi']:
+            raise CommandError('--inline-geocoding и --asgi вместе не работают')
+
+        configure_logging(options['logging'])
+        created_ids = []
+
+        def make_order():
+            return {
+                'firstname': 'Бенч',
+                'lastname': 'Маркович',
+                'phonenumber': '+79001234567',
+                'address': f'Москва, Бенчмарковая улица, {uuid.uuid4().hex[:8]}',
+                'products': [
+                    {'product': product_id, 'quantity': 1}
+                    for product_id in product_ids
+                ],
+            }
+
+        def check_response(response):
+            if response.status_code != 200:
+                raise CommandError(response.content.decode())
+            created_ids.append(response.json()['id'])
+
+        def register_order(number):
+            order = make_order()
+            check_response(client.post('/api/order/', order, content_type='application/json'))
+            if inline_geocoding:
+                GeocodeData.objects.fetch_coordinates(order['address'])
+
+        async def register_order_async(number):
+            check_response(await async_client.post(
+                '/api/order/', make_order(), content_type='application/json'))
+
+        client = test_client()
+        async_client = async_test_client()
+        with StubGeocoder(delay=options['geocoder_delay']) as stub:
+            with override_settings(
+                    YANDEX_GEOCODER_URL=stub.url,
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                try:
+                    if options['asgi']:
+                        latencies, elapsed = run_async_load(
+                            register_order_async, options['requests'], options['concurrency'])
+                    else:
+                        latencies, elapsed = run_load(
+                            register_order, options['requests'], options['concurrency'])
+                finally:
+                    Order.objects.filter(id__in=created_ids).delete()
+
+        name = 'inline geocoding' if inline_geocoding else 'deferred geocoding'
+        name = f'{name}, logging {options["logging"]}'
+        handler = 'asgi' if options['asgi'] else 'wsgi'
+        name = f'{name}, {handler} {resolve("/api/order/").func.__name__}'
+        self.stdout.write(format_summary(name, latency_summary(latencies, elapsed)))
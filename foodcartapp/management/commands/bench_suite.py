@@ -0,0 +1,117 @@
+import json
+import subprocess
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from foodcartapp.benchmarks import latency_summary, run_load, test_client
+from foodcartapp.models import Order, Product
+from foodcartapp.stub_geocoder import StubGeocoder
+
+SCENARIOS = ['products', 'register_order', 'manager_orders', 'manager_products']
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Гоняет нагрузку по основным страницам и API с заглушкой геокодера '
+        'и печатает задержки и пропускную способность в JSON. '
+        'Данные для прогона готовит команда seed_perf'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            help=f'какие сценарии гонять, можно несколько раз: {", ".join(SCENARIOS)}',
+        )
+        parser.add_argument('--geocoder-delay', type=float, default=0.05)
+        parser.add_argument('--output', help='сохранить результат в файл')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or SCENARIOS
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+
+        product_ids = list(
+            Product.objects.available().values_list('id', flat=True)[:3])
+        if 'register_order' in scenarios and not product_ids:
+            raise CommandError('В базе нет товаров в продаже, запустите seed_perf')
+
+        manager = User.objects.create_user(
+            f'bench-{uuid.uuid4().hex[:8]}', password=None, is_staff=True)
+        created_order_ids = []
+
+        def get(path, client):
+            def call(number):
+                response = client.get(path)
+                if response.status_code != 200:
+                    raise CommandError(f'{path}: {response.status_code}')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            return call
+
+        def register_order(client):
+            def call(number):
+                response = client.post('/api/order/', {
+                    'firstname': 'Бенч',
+                    'lastname': 'Маркович',
+                    'phonenumber': '+79001234567',
+                    'address': f'Москва, Бенчмарковая улица, {number}',
+                    'products': [
+                        {'product': product_id, 'quantity': 1}
+                        for product_id in product_ids
+                    ],
+                }, content_type='application/json')
+                if response.status_code != 200:
+                    raise CommandError(response.content.decode())
+                created_order_ids.append(response.json()['id'])
+            return call
+
+        client = test_client()
+        manager_client = test_client()
+        manager_client.force_login(manager)
+        calls = {
+            'products': get('/api/products/', client),
+            'register_order': register_order(client),
+            'manager_orders': get('/manager/orders/', manager_client),
+            'manager_products': get('/manager/products/', manager_client),
+        }
+
+        results = {}
+        with StubGeocoder(delay=options['geocoder_delay']) as stub:
+            with override_settings(YANDEX_GEOCODER_URL=stub.url):
+                try:
+                    for scenario in scenarios:
+                        latencies, elapsed = run_load(
+                            calls[scenario], options['requests'], options['concurrency'])
+                        results[scenario] = latency_summary(latencies, elapsed)
+                finally:
+                    Order.objects.filter(id__in=created_order_ids).delete()
+                    manager.delete()
+
+        report = json.dumps({
+            'revision': get_revision(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'database': settings.DATABASES['default']['ENGINE'],
+            'results': results,
+        }, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(report + '\n')
+        self.stdout.write(report)
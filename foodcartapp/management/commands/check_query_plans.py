@@ -0,0 +1,68 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from foodcartapp.models import Order, OrderItem, Product, RestaurantMenuItem
+
+GUARDED_TABLES = ['foodcartapp_order', 'foodcartapp_orderitem']
+
+SEQUENTIAL_SCAN_PATTERNS = {
+    'postgresql': r'Seq Scan on ({tables})\b',
+    'sqlite': r'\bSCAN (?:TABLE )?({tables})\b(?! USING)',
+}
+
+
+def get_hot_queries():
+    open_orders = Order.objects.get_not_done_orders_with_total_price()
+    open_order_ids = list(open_orders.values_list('id', flat=True)[:100]) or [0]
+    return {
+        'open orders board': open_orders.order_by('date_registration', 'id'),
+        'orders board changes': Order.objects.filter(
+            updated_at__gte=timezone.now() - timedelta(minutes=5)),
+        'open orders items': OrderItem.objects.filter(order_id__in=open_order_ids),
+        'catalogue': Product.objects.select_related('category').available(),
+        'menu availability': RestaurantMenuItem.objects.filter(
+            product_id__in=Product.objects.values('id')[:20], availability=True),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет EXPLAIN по горячим запросам и падает, если в плане '
+        'есть последовательное сканирование заказов или их позиций. '
+        'Запускайте на базе, заполненной seed-данными'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='обновить статистику планировщика перед проверкой',
+        )
+        parser.add_argument('--show-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'EXPLAIN для {connection.vendor} не поддерживается')
+        sequential_scan = re.compile(pattern.format(tables='|'.join(GUARDED_TABLES)))
+
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        failures = []
+        for name, queryset in get_hot_queries().items():
+            plan = queryset.explain()
+            if options['show_plans']:
+                self.stdout.write(f'--- {name}\n{plan}\n')
+            scans = sorted(set(sequential_scan.findall(plan)))
+            if scans:
+                failures.append(f'{name}: последовательное чтение {", ".join(scans)}')
+            else:
+                self.stdout.write(f'{name}: ok')
+
+        if failures:
+            raise CommandError('\n'.join(failures))
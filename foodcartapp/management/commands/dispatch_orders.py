@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import dispatch_new_orders
+
+
+class Command(BaseCommand):
+    help = 'Распределяет новые заказы по ресторанам, сокращая суммарный путь доставки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='посчитать распределение, но не сохранять',
+        )
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+        assignment, distance = dispatch_new_orders(dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - started_at
+        self.stdout.write(
+            f'Назначено заказов: {len(assignment)}, '
+            f'суммарное расстояние: {distance:.1f} км, за {elapsed:.2f} с'
+        )
@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.exports import (EXPORT_FORMATS, get_export_items,
+                                 iter_export_rows, render_export)
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает позиции заказов вместе с суммами заказов в CSV или NDJSON. '
+        'Строки читаются и пишутся потоком, так что память не растёт '
+        'с размером выгрузки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date.fromisoformat, help='например 2024-01-01')
+        parser.add_argument('--date-to', type=date.fromisoformat)
+        parser.add_argument(
+            '--status', choices=[status for status, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--restaurant', type=int, help='id ресторана')
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='файл, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        querysets = get_export_items(
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            status=options['status'],
+            restaurant=options['restaurant'],
+        )
+        lines = render_export(
+            iter_export_rows(querysets, chunk_size=options['chunk_size']),
+            options['format'],
+        )
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from foodcartapp.catalogue import invalidate_catalogue
+from foodcartapp.models import Product
+from foodcartapp.thumbnails import generate_thumbnails_safely, has_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Делает уменьшенные копии картинок товаров, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='пересоздать копии, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').only('id', 'image', 'thumbnails')
+        all_names = set()
+        names = set()
+        for product in products:
+            all_names.add(product.image.name)
+            if options['force'] or not has_thumbnails(product):
+                names.add(product.image.name)
+        names = sorted(names)
+        # Дочерние процессы не должны унаследовать открытые подключения к базе
+        connections.close_all()
+
+        started_at = time.perf_counter()
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            results = executor.map(generate_thumbnails_safely, names, chunksize=8)
+            for name, thumbnails in zip(names, results):
+                if thumbnails is None:
+                    failed += 1
+                    continue
+                Product.objects.filter(image=name).update(thumbnails=thumbnails)
+                created += 1
+        skipped = len(all_names) - len(names)
+
+        invalidate_catalogue()
+        self.stdout.write(
+            f'Картинок: {len(all_names)}, обработано {created}, уже были {skipped}, '
+            f'с ошибкой {failed}, за {time.perf_counter() - started_at:.1f} с'
+        )
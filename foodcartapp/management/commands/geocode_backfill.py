@@ -0,0 +1,166 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp import geocoder
+from foodcartapp.models import (GeocodeData, Order, Restaurant,
+                                refresh_open_orders_candidates)
+from foodcartapp.spatial import restaurant_index
+
+
+class Command(BaseCommand):
+    help = 'Находит координаты ресторанов и заказов, у которых их нет'
+
+    targets = {
+        'restaurants': Restaurant,
+        'orders': Order,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'target', nargs='*',
+            help='restaurants и/или orders, по умолчанию всё',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--rate', type=float, default=10,
+            help='не больше стольких запросов к геокодеру в секунду',
+        )
+        parser.add_argument(
+            '--state-file', default='geocode_backfill.json',
+            help='куда записывать прогресс, чтобы продолжить после остановки',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='начать сначала, не глядя на сохранённый прогресс',
+        )
+
+    def handle(self, *args, **options):
+        unknown_targets = set(options['target']) - self.targets.keys()
+        if unknown_targets:
+            raise CommandError(f'Неизвестные цели: {", ".join(sorted(unknown_targets))}')
+
+        self.state_file = options['state_file']
+        self.state = {} if options['restart'] else self.load_state()
+        self.session = geocoder.create_session(options['workers'])
+        self.rate_limiter = geocoder.RateLimiter(options['rate'])
+
+        for target in options['target'] or self.targets:
+            self.backfill(
+                target, self.targets[target],
+                options['chunk_size'], options['workers'],
+            )
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as file:
+            return json.load(file)
+
+    def save_state(self):
+        with open(self.state_file, 'w') as file:
+            json.dump(self.state, file)
+
+    def backfill(self, target, model, chunk_size, workers):
+        last_id = self.state.get(target, 0)
+        retry_key = f'{target}_retry'
+        retry_ids = set(self.state.get(retry_key, []))
+        rows = (
+            model.objects
+            .filter(latitude__isnull=True)
+            .exclude(address='')
+            .order_by('id')
+        )
+        total = rows.filter(id__gt=last_id).count()
+        self.stdout.write(
+            f'{target}: без координат {total}, начинаем после id={last_id}, '
+            f'к повтору {len(retry_ids)}'
+        )
+
+        processed = 0
+        started_at = time.monotonic()
+        while True:
+            chunk = list(rows.filter(id__gt=last_id).only('id', 'address')[:chunk_size])
+            if not chunk:
+                break
+
+            updated, failed_ids = self.geocode_chunk(model, chunk, workers)
+            retry_ids |= failed_ids
+
+            last_id = chunk[-1].id
+            self.state[target] = last_id
+            self.state[retry_key] = sorted(retry_ids)
+            self.save_state()
+
+            processed += len(chunk)
+            elapsed = time.monotonic() - started_at
+            throughput = processed / elapsed if elapsed else 0
+            eta = (total - processed) / throughput if throughput else 0
+            self.stdout.write(
+                f'{target}: {processed}/{total}, найдено {updated} в пачке, '
+                f'{throughput:.1f} строк/с, осталось ~{eta:.0f} с'
+            )
+
+        # Курсор уже ушёл дальше строк, на которых геокодер не ответил,
+        # поэтому их пробуем ещё раз отдельно. Что снова не ответило,
+        # остаётся в файле прогресса до следующего запуска.
+        ids = sorted(retry_ids)
+        for offset in range(0, len(ids), chunk_size):
+            chunk_ids = set(ids[offset:offset + chunk_size])
+            chunk = list(rows.filter(id__in=chunk_ids).only('id', 'address'))
+            _, failed_ids = self.geocode_chunk(model, chunk, workers)
+            retry_ids -= chunk_ids - failed_ids
+            self.state[retry_key] = sorted(retry_ids)
+            self.save_state()
+        if retry_ids:
+            self.stdout.write(
+                f'{target}: геокодер не ответил для {len(retry_ids)} строк, '
+                f'они будут повторены при следующем запуске'
+            )
+
+    def geocode_chunk(self, model, chunk, workers):
+        """Геокодирует пачку строк и возвращает число найденных и id строк,
+        на которых геокодер не ответил."""
+        resolved = GeocodeData.objects.resolve(
+            {row.address for row in chunk},
+            workers=workers,
+            session=self.session,
+            rate_limiter=self.rate_limiter,
+        )
+        updated = self.apply_coordinates(model, chunk, resolved)
+        return updated, {row.id for row in chunk if row.address not in resolved}
+
+    def apply_coordinates(self, model, chunk, resolved):
+        fields = ['latitude', 'longitude']
+        if model is Order:
+            fields.append('geocoding_status')
+
+        changed_rows = []
+        updated = 0
+        for row in chunk:
+            if row.address not in resolved:
+                continue
+            changed_rows.append(row)
+            coordinates = resolved[row.address]
+            if coordinates is not None:
+                row.latitude, row.longitude = coordinates
+                updated += 1
+            if model is Order:
+                row.geocoding_status = (
+                    Order.GeocodingStatus.FAILED if coordinates is None
+                    else Order.GeocodingStatus.DONE
+                )
+        model.objects.bulk_update(changed_rows, fields)
+        if model is Order:
+            Order.objects.filter(
+                id__in=[row.id for row in changed_rows],
+            ).refresh_candidate_restaurants()
+        elif updated:
+            # bulk_update не шлёт post_save, так что индекс ресторанов
+            # и рестораны открытых заказов обновляем сами
+            restaurant_index.invalidate()
+            refresh_open_orders_candidates()
+        return updated
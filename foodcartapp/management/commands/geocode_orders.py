@@ -0,0 +1,131 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from foodcartapp import geocoder
+from foodcartapp.geocache import geocode_cache
+from foodcartapp.models import GeocodeData, Order
+
+
+class Command(BaseCommand):
+    help = 'Фоновый воркер: находит координаты адресов новых заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='разобрать очередь и выйти',
+        )
+
+    def handle(self, *args, **options):
+        session = geocoder.create_session(options['workers'])
+        while True:
+            processed = self.process_batch(
+                session, options['workers'], options['batch_size'])
+            if processed:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def process_batch(self, session, workers, batch_size):
+        # Заказы, на которых геокодер не ответил, ждут своего
+        # `geocoding_retry_at` и не занимают голову очереди
+        pending = (
+            Order.objects
+            .filter(geocoding_status=Order.GeocodingStatus.PENDING)
+            .filter(
+                Q(geocoding_retry_at__isnull=True)
+                | Q(geocoding_retry_at__lte=timezone.now())
+            )
+            .order_by('id')
+            .values_list('id', 'address', 'geocoding_attempts')[:batch_size]
+        )
+        orders_by_address = {}
+        attempts = {}
+        for order_id, address, order_attempts in pending:
+            orders_by_address.setdefault(address, []).append(order_id)
+            attempts[order_id] = order_attempts
+        if not orders_by_address:
+            return 0
+
+        resolved = GeocodeData.objects.resolve(
+            orders_by_address, workers=workers, session=session)
+
+        processed = 0
+        processed_ids = []
+        now = timezone.now()
+        for address, coordinates in resolved.items():
+            orders = Order.objects.filter(
+                id__in=orders_by_address[address],
+                geocoding_status=Order.GeocodingStatus.PENDING,
+            )
+            processed_ids.extend(orders_by_address[address])
+            if coordinates is None:
+                processed += orders.update(
+                    geocoding_status=Order.GeocodingStatus.FAILED,
+                    updated_at=now,
+                )
+                continue
+            lat, lon = coordinates
+            processed += orders.update(
+                latitude=lat,
+                longitude=lon,
+                geocoding_status=Order.GeocodingStatus.DONE,
+                updated_at=now,
+            )
+
+        unanswered = [
+            order_id
+            for address, order_ids in orders_by_address.items()
+            if address not in resolved
+            for order_id in order_ids
+        ]
+        processed += self.postpone(unanswered, attempts, now)
+        processed_ids.extend(unanswered)
+
+        Order.objects.filter(id__in=processed_ids).refresh_candidate_restaurants()
+
+        cache_stats = ', '.join(
+            f'{name}={value}' for name, value in geocode_cache.stats().items())
+        self.stdout.write(
+            f'Обработано заказов: {processed}, адресов: {len(resolved)}'
+            f' из {len(orders_by_address)}. Кэш геокодера: {cache_stats}'
+        )
+        return processed
+
+    @staticmethod
+    def postpone(order_ids, attempts, now):
+        """Откладывает заказы, на которых геокодер не ответил.
+
+        Пауза перед повтором растёт вдвое с каждой попыткой, начиная
+        с `GEOCODE_RETRY_DELAY` секунд. После `GEOCODE_MAX_ATTEMPTS` попыток
+        заказ получает статус FAILED, как с ненайденным адресом.
+        """
+        orders = []
+        for order_id in order_ids:
+            order_attempts = attempts[order_id] + 1
+            order = Order(id=order_id, geocoding_attempts=order_attempts, updated_at=now)
+            if order_attempts >= settings.GEOCODE_MAX_ATTEMPTS:
+                order.geocoding_status = Order.GeocodingStatus.FAILED
+                order.geocoding_retry_at = None
+            else:
+                order.geocoding_status = Order.GeocodingStatus.PENDING
+                order.geocoding_retry_at = now + timedelta(
+                    seconds=settings.GEOCODE_RETRY_DELAY * 2 ** (order_attempts - 1))
+            orders.append(order)
+        Order.objects.bulk_update(
+            orders,
+            ['geocoding_attempts', 'geocoding_retry_at', 'geocoding_status', 'updated_at'],
+            batch_size=500,
+        )
+        return len(orders)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.rollups import refresh_daily_sales
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет сводную таблицу продаж по дням за дни, где менялись '
+        'заказы. Запускайте из cron, например раз в 5 минут'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='пересчитать таблицу целиком',
+        )
+        parser.add_argument('--chunk-days', type=int, default=31)
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+        days = refresh_daily_sales(
+            rebuild=options['rebuild'], chunk_days=options['chunk_days'])
+        self.stdout.write(
+            f'Пересчитано дней: {days}, за {time.perf_counter() - started_at:.2f} с')
@@ -0,0 +1,175 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from foodcartapp.menu_index import menu_index
+from foodcartapp.models import (Order, OrderItem, Product, ProductCategory,
+                                Restaurant, RestaurantMenuItem)
+from foodcartapp.spatial import restaurant_index
+
+SEED_PREFIX = 'perf'
+SEED_COMMENT = 'seed_perf'
+MOSCOW_CENTER = (55.751244, 37.618423)
+FIRSTNAMES = ['Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий']
+LASTNAMES = ['Иванов', 'Петрова', 'Сидоров', 'Смирнова', 'Кузнецов', 'Попова']
+STREETS = ['Тверская', 'Арбат', 'Мясницкая', 'Пятницкая', 'Ленинский проспект', 'Профсоюзная']
+
+
+def bulk_create_with_ids(model, objects, batch_size):
+    """`bulk_create`, после которого у объектов точно есть id.
+
+    PostgreSQL возвращает id сам, а для SQLite перечитываем вставленные
+    строки: они идут по возрастанию id в том же порядке.
+    """
+    last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    created = model.objects.bulk_create(objects, batch_size=batch_size)
+    if not created or created[0].pk is not None:
+        return created
+    return list(model.objects.filter(id__gt=last_id).order_by('id'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими ресторанами, товарами и заказами '
+        'для нагрузочных тестов. С одним и тем же --seed данные одинаковые'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--restaurants', type=int, default=50)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--products', type=int, default=300)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument(
+            '--open-share', type=float, default=0.1,
+            help='доля незавершённых заказов',
+        )
+        parser.add_argument(
+            '--days', type=int, default=90,
+            help='за сколько дней раскидать завершённые заказы',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='удалить данные, созданные этой командой раньше',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+
+            categories = bulk_create_with_ids(ProductCategory, [
+                ProductCategory(name=f'{SEED_PREFIX} категория {number}')
+                for number in range(options['categories'])
+            ], batch_size)
+            products = bulk_create_with_ids(Product, [
+                Product(
+                    name=f'{SEED_PREFIX} товар {number}',
+                    category=rng.choice(categories) if categories else None,
+                    price=Decimal(rng.randrange(100, 1500, 10)),
+                    image=f'{SEED_PREFIX}.jpg',
+                    special_status=rng.random() < 0.1,
+                    description='Синтетический товар для нагрузочного теста',
+                )
+                for number in range(options['products'])
+            ], batch_size)
+            restaurants = bulk_create_with_ids(Restaurant, [
+                Restaurant(
+                    name=f'{SEED_PREFIX} ресторан {number}',
+                    address=self.fake_address(rng),
+                    contact_phone='+79001234567',
+                    latitude=self.fake_coordinate(rng, MOSCOW_CENTER[0], 0.2),
+                    longitude=self.fake_coordinate(rng, MOSCOW_CENTER[1], 0.35),
+                    delivery_radius=Decimal(rng.randrange(5, 20)),
+                    capacity=rng.randrange(5, 30),
+                )
+                for number in range(options['restaurants'])
+            ], batch_size)
+            RestaurantMenuItem.objects.bulk_create([
+                RestaurantMenuItem(
+                    restaurant=restaurant,
+                    product=product,
+                    availability=rng.random() < 0.9,
+                )
+                for restaurant in restaurants
+                for product in products
+                if rng.random() < 0.7
+            ], batch_size=batch_size)
+
+            orders_count = self.create_orders(rng, products, options)
+
+        menu_index.invalidate()
+        restaurant_index.invalidate()
+        self.stdout.write(
+            f'Создано: ресторанов {len(restaurants)}, категорий {len(categories)}, '
+            f'товаров {len(products)}, заказов {orders_count}'
+        )
+
+    def create_orders(self, rng, products, options):
+        if not products:
+            return 0
+        open_statuses = ['NEW', 'CONFIRMED', 'IN_PROGRESS']
+        orders = []
+        items_by_order = []
+        for number in range(options['orders']):
+            is_open = rng.random() < options['open_share']
+            items = [
+                (product, rng.randint(1, 3))
+                for product in rng.sample(products, rng.randint(1, min(5, len(products))))
+            ]
+            orders.append(Order(
+                firstname=rng.choice(FIRSTNAMES),
+                lastname=rng.choice(LASTNAMES),
+                phonenumber=f'+7900{rng.randrange(10 ** 7):07d}',
+                address=self.fake_address(rng),
+                latitude=self.fake_coordinate(rng, MOSCOW_CENTER[0], 0.2),
+                longitude=self.fake_coordinate(rng, MOSCOW_CENTER[1], 0.35),
+                geocoding_status=Order.GeocodingStatus.DONE,
+                status=rng.choice(open_statuses) if is_open else 'DONE',
+                payment_method=rng.choice(Order.PaymentMethod.values),
+                comment=SEED_COMMENT,
+                total_price=sum(product.price * quantity for product, quantity in items),
+            ))
+            items_by_order.append(items)
+
+        orders = bulk_create_with_ids(Order, orders, options['batch_size'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for order, items in zip(orders, items_by_order)
+            for product, quantity in items
+        ], batch_size=options['batch_size'])
+
+        ids_by_day = {}
+        for order in orders:
+            if order.status == 'DONE':
+                ids_by_day.setdefault(rng.randrange(options['days'] or 1), []).append(order.id)
+        now = timezone.now()
+        for day, order_ids in ids_by_day.items():
+            Order.objects.filter(id__in=order_ids).update(
+                date_registration=now - timedelta(days=day, hours=1),
+                delivered_at=now - timedelta(days=day),
+            )
+        return len(orders)
+
+    @staticmethod
+    def fake_address(rng):
+        return f'Москва, {rng.choice(STREETS)}, {rng.randint(1, 150)}'
+
+    @staticmethod
+    def fake_coordinate(rng, center, spread):
+        return Decimal(f'{center + rng.uniform(-spread, spread):.6f}')
+
+    def clear(self):
+        Order.objects.filter(comment=SEED_COMMENT).delete()
+        Restaurant.objects.filter(name__startswith=f'{SEED_PREFIX} ').delete()
+        Product.objects.filter(name__startswith=f'{SEED_PREFIX} ').delete()
+        ProductCategory.objects.filter(name__startswith=f'{SEED_PREFIX} ').delete()
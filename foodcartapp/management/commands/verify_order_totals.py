@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённую стоимость заказов с суммой их позиций'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='пересчитать стоимость заказов, где она разошлась',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = 0
+        drifted_count = 0
+        fixed = 0
+        last_id = 0
+        while True:
+            chunk_ids = list(
+                Order.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not chunk_ids:
+                break
+            last_id = chunk_ids[-1]
+            checked += len(chunk_ids)
+
+            drifted = (
+                Order.objects
+                .filter(id__in=chunk_ids)
+                .with_calculated_total_price()
+                .exclude(total_price=F('calculated_total_price'))
+                .values_list('id', 'total_price', 'calculated_total_price')
+            )
+            drifted_ids = []
+            for order_id, total_price, calculated_total_price in drifted:
+                drifted_ids.append(order_id)
+                self.stdout.write(
+                    f'Заказ {order_id}: сохранено {total_price}, '
+                    f'по позициям {calculated_total_price}'
+                )
+            drifted_count += len(drifted_ids)
+            if options['fix'] and drifted_ids:
+                fixed += Order.objects.filter(id__in=drifted_ids).refresh_total_prices()
+
+        self.stdout.write(
+            f'Проверено заказов: {checked}, расхождений: {drifted_count}, '
+            f'исправлено: {fixed}'
+        )
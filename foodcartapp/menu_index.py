@@ -0,0 +1,162 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+MENU_VERSION_CACHE_KEY = 'foodcartapp:menu_version'
+
+
+class MenuAvailabilityIndex:
+    """Битовые маски доступности товаров по ресторанам.
+
+    Для каждого товара хранится целое число, в котором бит ресторана
+    выставлен, если товар есть в его меню и в продаже. Рестораны, способные
+    приготовить заказ, находятся побитовым И масок всех товаров заказа.
+
+    Индекс строится лениво одним запросом, обновляется после коммита
+    сигналами по `RestaurantMenuItem`, сбрасывается при удалении ресторана
+    и целиком перестраивается раз в
+    `MENU_INDEX_TTL` секунд, чтобы подтянуть правки из других процессов.
+    Страницы, которым нужна свежая картина, зовут `ensure_current`: после
+    каждой правки меню в кэш пишется новая версия, и индекс другого
+    процесса перестраивается, увидев чужую версию.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._version = None
+        self._positions = {}
+        self._restaurant_ids = []
+        self._product_masks = {}
+        self._items = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def build(self):
+        from .models import Restaurant, RestaurantMenuItem
+
+        version = cache.get(MENU_VERSION_CACHE_KEY)
+        restaurant_ids = list(
+            Restaurant.objects.order_by('id').values_list('id', flat=True))
+        items = RestaurantMenuItem.objects.values_list(
+            'id', 'restaurant_id', 'product_id', 'availability')
+
+        positions = {
+            restaurant_id: position
+            for position, restaurant_id in enumerate(restaurant_ids)
+        }
+        product_masks = {}
+        indexed_items = {}
+        for item_id, restaurant_id, product_id, availability in items:
+            indexed_items[item_id] = (restaurant_id, product_id)
+            if availability:
+                product_masks[product_id] = (
+                    product_masks.get(product_id, 0)
+                    | 1 << positions[restaurant_id]
+                )
+
+        with self._lock:
+            self._positions = positions
+            self._restaurant_ids = restaurant_ids
+            self._product_masks = product_masks
+            self._items = indexed_items
+            self._version = version
+            self._built_at = time.monotonic()
+
+    def ensure_built(self):
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > settings.MENU_INDEX_TTL:
+            self.build()
+
+    def ensure_current(self):
+        if cache.get(MENU_VERSION_CACHE_KEY) != self._version:
+            self.build()
+        else:
+            self.ensure_built()
+
+    def publish(self):
+        """Сообщает другим процессам, что меню изменилось."""
+        version = uuid.uuid4().hex
+        cache.set(MENU_VERSION_CACHE_KEY, version, None)
+        with self._lock:
+            if self._built_at is not None:
+                self._version = version
+
+    def _position(self, restaurant_id):
+        position = self._positions.get(restaurant_id)
+        if position is None:
+            position = len(self._restaurant_ids)
+            self._positions[restaurant_id] = position
+            self._restaurant_ids.append(restaurant_id)
+        return position
+
+    def _set_bit(self, restaurant_id, product_id, available):
+        bit = 1 << self._position(restaurant_id)
+        mask = self._product_masks.get(product_id, 0)
+        self._product_masks[product_id] = mask | bit if available else mask & ~bit
+
+    def update_item(self, item):
+        with self._lock:
+            if self._built_at is None:
+                return
+            # После bulk_create(ignore_conflicts=True) у пунктов меню нет id
+            if item.id is not None:
+                previous = self._items.get(item.id)
+                if previous and previous != (item.restaurant_id, item.product_id):
+                    self._set_bit(*previous, available=False)
+                self._items[item.id] = (item.restaurant_id, item.product_id)
+            self._set_bit(item.restaurant_id, item.product_id, item.availability)
+
+    def update_items(self, items):
+        with self._lock:
+            for item in items:
+                self.update_item(item)
+
+    def remove_item(self, item):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._items.pop(item.id, None)
+            self._set_bit(item.restaurant_id, item.product_id, available=False)
+
+    def restaurants_mask(self, product_ids):
+        self.ensure_built()
+        mask = (1 << len(self._restaurant_ids)) - 1
+        for product_id in set(product_ids):
+            mask &= self._product_masks.get(product_id, 0)
+            if not mask:
+                break
+        return mask
+
+    def eligible_restaurant_ids(self, product_ids):
+        with self._lock:
+            mask = self.restaurants_mask(product_ids)
+            restaurant_ids = self._restaurant_ids
+        eligible = set()
+        while mask:
+            lowest_bit = mask & -mask
+            eligible.add(restaurant_ids[lowest_bit.bit_length() - 1])
+            mask ^= lowest_bit
+        return eligible
+
+    def product_masks(self, product_ids, restaurant_ids):
+        """Маски товаров и номера битов ресторанов в порядке `restaurant_ids`.
+
+        Бит ресторана `restaurant_ids[i]` в маске товара — `1 << columns[i]`.
+        """
+        self.ensure_current()
+        with self._lock:
+            columns = [self._position(restaurant_id) for restaurant_id in restaurant_ids]
+            masks = {
+                product_id: self._product_masks.get(product_id, 0)
+                for product_id in product_ids
+            }
+        return columns, masks
+
+
+menu_index = MenuAvailabilityIndex()
@@ -1,19 +1,20 @@
-import copy
-import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import timedelta
 
-import requests
-from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import F, Prefetch, Sum
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from geopy.distance import geodesic
-from geopy.exc import GeocoderServiceError, GeocoderTimedOut
 from phonenumber_field.modelfields import PhoneNumberField
 
-logging.basicConfig(filename='log.txt', filemode='a', level=logging.INFO)
+from . import geocoder
+from .geocache import geocode_cache, normalize_address
+from .menu_index import menu_index
+from .spatial import restaurant_index
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,17 @@ class Restaurant(models.Model):
         max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(
         max_digits=9, decimal_places=6, null=True, blank=True)
+    delivery_radius = models.DecimalField(
+        'радиус доставки, км',
+        max_digits=5,
+        decimal_places=2,
+        default=10,
+        validators=[MinValueValidator(0)],
+    )
+    capacity = models.PositiveIntegerField(
+        'сколько заказов готовит одновременно',
+        default=10,
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -92,6 +104,12 @@ class Product(models.Model):
     image = models.ImageField(
         'картинка'
     )
+    thumbnails = models.JSONField(
+        'уменьшенные копии картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
     special_status = models.BooleanField(
         'спец.предложение',
         default=False,
@@ -108,6 +126,10 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
+        indexes = [
+            models.Index(fields=['category', 'id']),
+            models.Index(fields=['special_status', 'id']),
+        ]
 
     def __str__(self):
         return self.name
@@ -138,49 +160,138 @@ class RestaurantMenuItem(models.Model):
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            models.Index(fields=['restaurant', 'availability', 'product']),
+            models.Index(fields=['product', 'availability']),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+_order_deletion = threading.local()
+
+
+@contextmanager
+def deleting_orders():
+    """Отмечает, что в этом потоке удаляются заказы вместе с позициями."""
+    previous = getattr(_order_deletion, 'active', False)
+    _order_deletion.active = True
+    try:
+        yield
+    finally:
+        _order_deletion.active = previous
+
+
+def is_deleting_orders():
+    return getattr(_order_deletion, 'active', False)
+
+
 class OrderQuerySet(models.QuerySet):
-    def with_total_price(self):
+    def delete(self):
+        with deleting_orders():
+            return super().delete()
+
+    def with_calculated_total_price(self):
         return self.annotate(
-            total_price=Sum(
-                F('order_items__price') * F('order_items__quantity')
+            calculated_total_price=Coalesce(
+                Sum(F('order_items__price') * F('order_items__quantity')),
+                Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
             )
         )
+
     def get_not_done_orders_with_total_price(self):
-        return self.with_total_price().exclude(status='DONE')
-
-    def get_orders_with_restaurants(self, restaurants):
-        for order in self:
-            order_location = (order.longitude, order.latitude)
-            order.restaurants = []
-            for restaurant in restaurants:
-                restaurant_location = (restaurant.longitude, restaurant.latitude)
-                restaurant_copy = copy.deepcopy(restaurant)
-                if restaurant_location is not None and order_location is not None:
-                    try:
-                        restaurant_copy.distance = geodesic(
-                            restaurant_location, order_location).km
-                    except GeocoderTimedOut:
-                        restaurant_copy.distance = None
-                        logger.error(
-                            "GeocoderTimedOut occurred, setting distance to None"
-                        )
-                    except GeocoderServiceError:
-                        restaurant_copy.distance = None
-                        logger.error(
-                            "GeocoderServiceError occurred, setting distance to None"
-                        )
-                else:
-                    restaurant_copy.distance = None
-                order.restaurants.append(restaurant_copy)
-            order.restaurants = sorted(
-                order.restaurants, key=lambda r: r.distance if r.distance is not None else float('inf'))
+        return self.exclude(status='DONE')
+
+    def refresh_total_prices(self):
+        """Пересчитывает сохранённую стоимость заказов одним UPDATE."""
+        items_total = (
+            OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity')))
+            .values('total')
+        )
+        return self.update(
+            total_price=Coalesce(
+                Subquery(items_total),
+                Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
+        )
+
+    def get_orders_with_restaurants(self, mode=None):
+        attach_candidate_restaurants(self, mode=mode)
         return self
 
+    def refresh_candidate_restaurants(self):
+        """Пересчитывает и сохраняет подходящие заказам рестораны.
+
+        Пишутся только заказы, у которых список ресторанов изменился.
+        Они получают свежий `updated_at`, чтобы изменения увидела живая
+        доска заказов менеджера, а остальные на доске не перерисовываются.
+        Возвращает число изменённых заказов.
+        """
+        orders = list(
+            self.only('id', 'latitude', 'longitude', 'candidate_restaurants')
+            .prefetch_related(Prefetch(
+                'order_items',
+                queryset=OrderItem.objects.only('id', 'order_id', 'product_id'),
+            ))
+        )
+        stored = {order.id: order.candidate_restaurants for order in orders}
+        fill_candidate_restaurants(orders)
+
+        now = timezone.now()
+        changed = []
+        for order in orders:
+            if order.candidate_restaurants == stored[order.id]:
+                continue
+            order.updated_at = now
+            changed.append(order)
+        self.model.objects.bulk_update(
+            changed, ['candidate_restaurants', 'updated_at'], batch_size=500)
+        return len(changed)
+
+
+def attach_candidate_restaurants(orders, mode=None):
+    """Раскладывает по заказам рестораны, которые могут их приготовить.
+
+    В `order.restaurants` попадают рестораны, у которых в продаже все
+    товары заказа и в радиус доставки которых попадает его адрес,
+    от ближайшего к дальнему. Рестораны без координат идут в конце списка
+    с неизвестным расстоянием, как и все подходящие рестораны для заказов,
+    адрес которых ещё не геокодирован.
+    """
+    for order in orders:
+        eligible_ids = menu_index.eligible_restaurant_ids(
+            item.product_id for item in order.order_items.all()
+        )
+        if order.latitude is not None and order.longitude is not None:
+            order.restaurants = restaurant_index.nearest(
+                order.latitude, order.longitude,
+                eligible_ids=eligible_ids, mode=mode,
+            )
+        else:
+            order.restaurants = restaurant_index.located(eligible_ids)
+        order.restaurants += restaurant_index.unlocated(eligible_ids)
+    return orders
+
+
+def fill_candidate_restaurants(orders):
+    """Считает `candidate_restaurants` заказов, ничего не сохраняя в базу."""
+    attach_candidate_restaurants(orders)
+    for order in orders:
+        order.candidate_restaurants = [
+            restaurant._asdict() for restaurant in order.restaurants
+        ]
+    return orders
+
+
+def refresh_open_orders_candidates():
+    return Order.objects.exclude(status='DONE').refresh_candidate_restaurants()
 
 
 class Order(models.Model):
@@ -189,6 +300,11 @@ class Order(models.Model):
         CASH = 'C', 'Наличными'
         NOT_INDICATED = 'N', 'Не указано'
 
+    class GeocodingStatus(models.TextChoices):
+        PENDING = 'PENDING', 'Ожидает'
+        DONE = 'DONE', 'Найдены координаты'
+        FAILED = 'FAILED', 'Адрес не найден'
+
     STATUS_CHOICES = [
         ('NEW', 'Новый заказ'),
         ('CONFIRMED', 'Подтверждён'),
@@ -229,6 +345,24 @@ class Order(models.Model):
         max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(
         max_digits=9, decimal_places=6, null=True, blank=True)
+    geocoding_status = models.CharField(
+        'геокодирование',
+        max_length=7,
+        choices=GeocodingStatus.choices,
+        default=GeocodingStatus.PENDING,
+        db_index=True,
+    )
+    geocoding_attempts = models.PositiveSmallIntegerField(
+        'попыток геокодирования',
+        default=0,
+        editable=False,
+    )
+    geocoding_retry_at = models.DateTimeField(
+        'повторить геокодирование после',
+        null=True,
+        blank=True,
+        editable=False,
+    )
     objects = OrderQuerySet.as_manager()
     date_registration = models.DateTimeField(
         auto_now_add=True,
@@ -244,35 +378,47 @@ class Order(models.Model):
         on_delete=models.SET_NULL,
     )
     comment = models.TextField(blank=True, default='')
+    total_price = models.DecimalField(
+        'стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        editable=False,
+    )
+    candidate_restaurants = models.JSONField(
+        'подходящие рестораны',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
-
-    def items_list(self, obj):
-        return ", ".join([str(item) for item in obj.items.all()])
-    items_list.short_description = 'Items'
+        indexes = [
+            models.Index(
+                fields=['date_registration', 'id'],
+                name='order_open_registration_idx',
+                condition=~models.Q(status='DONE'),
+            ),
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['assigned_restaurant', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.firstname} {self.lastname} - {self.address}"
 
     @property
     def suitable_restaurants(self):
-        suitable_restaurants = []
-        restaurants = Restaurant.objects.prefetch_related(
-            Prefetch('menu_items', queryset=RestaurantMenuItem.objects.filter(
-                availability=True))
+        eligible_ids = menu_index.eligible_restaurant_ids(
+            item.product_id for item in self.order_items.all()
         )
-        order_products = self.items.all()
+        return list(Restaurant.objects.filter(id__in=eligible_ids))
 
-        for restaurant in restaurants:
-            menu_products = [
-                item.product for item in restaurant.menu_items.all()
-            ]
-            if set(order_products).issubset(menu_products):
-                suitable_restaurants.append(restaurant)
-
-        return suitable_restaurants
+    def delete(self, *args, **kwargs):
+        with deleting_orders():
+            return super().delete(*args, **kwargs)
 
 
 class OrderItem(models.Model):
@@ -302,45 +448,272 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = 'пункт меню заказа'
         verbose_name_plural = 'пункты меню заказа'
+        indexes = [
+            models.Index(fields=['order', 'product']),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
 
 
+class DeletedOrder(models.Model):
+    """Отметка об удалённом заказе.
+
+    По ней доска менеджера убирает строку заказа, а `rollup_sales`
+    пересчитывает день, в котором заказ был зарегистрирован. Пишется
+    сигналом `post_delete`, старые отметки удаляются там же.
+    """
+    order_id = models.IntegerField('id заказа')
+    date_registration = models.DateTimeField('дата регистрации заказа', null=True)
+    deleted_at = models.DateTimeField('удалён', default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'удалённый заказ'
+        verbose_name_plural = 'удалённые заказы'
+
+    def __str__(self):
+        return f"{self.order_id}: {self.deleted_at}"
+
+
+class ArchivedOrder(models.Model):
+    """Выполненный заказ, перенесённый из `Order` командой `archive_orders`.
+
+    id совпадает с id исходного заказа.
+    """
+    id = models.IntegerField('id заказа', primary_key=True)
+    payment_method = models.CharField(
+        'способ оплаты',
+        max_length=1,
+        choices=Order.PaymentMethod.choices,
+    )
+    status = models.CharField(
+        max_length=12,
+        choices=Order.STATUS_CHOICES,
+    )
+    firstname = models.CharField('имя', max_length=50)
+    lastname = models.CharField('фамилия', max_length=50, db_index=True)
+    phonenumber = PhoneNumberField('номер телефона', max_length=20, db_index=True)
+    address = models.CharField('адрес', max_length=250)
+    latitude = models.DecimalField(
+        max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(
+        max_digits=9, decimal_places=6, null=True, blank=True)
+    date_registration = models.DateTimeField('дата регистрации', db_index=True)
+    called_at = models.DateTimeField(blank=True, null=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+    assigned_restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_orders',
+        verbose_name='ресторан',
+    )
+    comment = models.TextField(blank=True, default='')
+    total_price = models.DecimalField(
+        'стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+    )
+    archived_at = models.DateTimeField('в архиве с', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'архивный заказ'
+        verbose_name_plural = 'архивные заказы'
+
+    def __str__(self):
+        return f"{self.firstname} {self.lastname} - {self.address}"
+
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        verbose_name='заказ',
+        related_name='order_items'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name='продукт',
+        related_name='archived_items'
+    )
+    quantity = models.IntegerField('количество')
+    price = models.DecimalField('цена', max_digits=8, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'пункт архивного заказа'
+        verbose_name_plural = 'пункты архивного заказа'
+
+    def __str__(self):
+        return f"{self.product.name if self.product else '-'} - {self.quantity}"
+
+
+class DailySales(models.Model):
+    """Продажи за день: сколько штук товара продал ресторан и на какую сумму.
+
+    Таблицу ведёт команда `rollup_sales` по выполненным заказам, включая
+    архивные. Отчёты читают только её.
+    """
+    day = models.DateField('день')
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='daily_sales',
+        verbose_name='ресторан',
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='daily_sales',
+        verbose_name='товар',
+    )
+    quantity = models.PositiveIntegerField('продано, шт.')
+    revenue = models.DecimalField('выручка', max_digits=12, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'продажи за день'
+        verbose_name_plural = 'продажи по дням'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'restaurant', 'product'],
+                name='daily_sales_day_restaurant_product_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.restaurant} {self.product}: {self.quantity}"
+
+
+class RollupWatermark(models.Model):
+    """До какого момента `updated_at` заказов уже учтены в сводной таблице."""
+    name = models.CharField('сводная таблица', max_length=50, unique=True)
+    value = models.DateTimeField('учтено до')
+
+    class Meta:
+        verbose_name = 'отметка пересчёта'
+        verbose_name_plural = 'отметки пересчёта'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class GeocodeDataManager(models.Manager):
 
-    def fetch_coordinates(self, address):
+    def fresh(self):
         one_week_ago = timezone.now() - timedelta(weeks=1)
-        geodata = self.filter(
-            address=address, updated_at__gte=one_week_ago).first()
-
-        if geodata is not None:
-            return geodata.latitude, geodata.longitude
-
-        try:
-            base_url = "https://geocode-maps.yandex.ru/1.x"
-            response = requests.get(base_url, params={
-                "geocode": address,
-                "apikey": settings.YANDEX_API_KEY,
-                "format": "json",
-            })
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Problem with request: {e}")
-            return None
-
-        try:
-            found_places = response.json()['response']['GeoObjectCollection']['featureMember']
-        except (KeyError, json.JSONDecodeError) as e:
-            logger.error(f"Problem parsing response JSON: {e}")
-            return None
-
-        if not found_places:
-            return None
-        most_relevant = found_places[0]
-        lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-        self.create(address=address, latitude=lat, longitude=lon)
-        return lat, lon
+        return self.filter(updated_at__gte=one_week_ago)
+
+    def get_cached_coordinates(self, addresses_by_key):
+        """Координаты из таблицы для ключей `addresses_by_key`.
+
+        Строки, записанные до нормализации адресов, лежат под исходным
+        адресом. Их тоже находим и переписываем под ключ, чтобы
+        не геокодировать заново.
+        """
+        keys_by_address = {
+            address: key for key, address in addresses_by_key.items()
+            if address != key
+        }
+        coordinates = {}
+        legacy_rows = []
+        for geodata in self.fresh().filter(
+                address__in=[*addresses_by_key, *keys_by_address]):
+            if geodata.address in addresses_by_key:
+                coordinates[geodata.address] = (geodata.latitude, geodata.longitude)
+            else:
+                legacy_rows.append(geodata)
+        for geodata in legacy_rows:
+            key = keys_by_address[geodata.address]
+            if key not in coordinates:
+                coordinates[key] = (geodata.latitude, geodata.longitude)
+                self.save_coordinates(key, geodata.latitude, geodata.longitude)
+        return coordinates
+
+    def save_coordinates(self, key, lat, lon):
+        self.update_or_create(
+            address=key,
+            defaults={'latitude': lat, 'longitude': lon},
+        )
+
+    def fetch_coordinates(self, address, session=None):
+        return self.resolve([address], workers=1, session=session).get(address)
+
+    def resolve(self, addresses, workers=4, session=None, rate_limiter=None):
+        """Находит координаты сразу для пачки адресов.
+
+        Адреса нормализуются, и за каждым ключом по очереди идём в кэш
+        в памяти, в таблицу `GeocodeData` и только потом в геокодер —
+        параллельно в `workers` потоков, не чаще, чем позволяет
+        `rate_limiter`. Возвращает словарь адрес → `(lat, lon)` или `None`,
+        если адрес не нашёлся. Адреса, на которых геокодер не ответил,
+        в словарь не попадают.
+        """
+        keys = {address: normalize_address(address) for address in set(addresses)}
+        addresses_by_key = {}
+        for address, key in keys.items():
+            addresses_by_key.setdefault(key, address)
+
+        resolved = {}
+        for key in addresses_by_key:
+            found, coordinates = geocode_cache.get(key)
+            if found:
+                resolved[key] = coordinates
+
+        missing = addresses_by_key.keys() - resolved.keys()
+        if missing:
+            missing_addresses = {key: addresses_by_key[key] for key in missing}
+            for key, coordinates in self.get_cached_coordinates(missing_addresses).items():
+                geocode_cache.set(key, coordinates)
+                resolved[key] = coordinates
+            missing -= resolved.keys()
+
+        if missing:
+            for key, coordinates in self._geocode(
+                    addresses_by_key, missing, workers, session, rate_limiter):
+                if coordinates is not None:
+                    self.save_coordinates(key, *coordinates)
+                geocode_cache.set(key, coordinates)
+                resolved[key] = coordinates
+
+        return {
+            address: resolved[key]
+            for address, key in keys.items()
+            if key in resolved
+        }
+
+    def _geocode(self, addresses_by_key, keys, workers, session, rate_limiter):
+        session = session or geocoder.create_session(workers)
+        if workers == 1 or len(keys) == 1:
+            for key in keys:
+                try:
+                    yield key, geocoder.fetch_coordinates(
+                        addresses_by_key[key], session, rate_limiter)
+                except geocoder.GeocoderError:
+                    continue
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    geocoder.fetch_coordinates,
+                    addresses_by_key[key], session, rate_limiter,
+                ): key
+                for key in keys
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except geocoder.GeocoderError:
+                    continue
 
 
 class GeocodeData(models.Model):
@@ -0,0 +1,162 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (ArchivedOrder, ArchivedOrderItem, DailySales,
+                     DeletedOrder, Order, OrderItem, RollupWatermark)
+
+SALES_ROLLUP = 'daily_sales'
+
+REPORT_GROUPS = {
+    'day': ['day'],
+    'restaurant': ['restaurant_id', 'restaurant__name'],
+    'product': ['product_id', 'product__name'],
+}
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def aggregate_sales(items, days):
+    """Суммирует позиции выполненных заказов по (день, ресторан, товар)."""
+    return (
+        items
+        .filter(
+            order__status='DONE',
+            order__date_registration__gte=day_start(min(days)),
+            order__date_registration__lt=day_start(max(days) + timedelta(days=1)),
+        )
+        .annotate(day=TruncDate('order__date_registration'))
+        .filter(day__in=days)
+        .values('day', 'order__assigned_restaurant', 'product')
+        .annotate(
+            sold=Sum('quantity'),
+            earned=Sum(
+                F('quantity') * F('price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        .order_by()
+    )
+
+
+def build_daily_sales(days):
+    # Рабочие и архивные позиции читаются одним UNION ALL, то есть из одного
+    # снимка базы: заказ, который архивируют прямо сейчас, не попадёт
+    # в сумму дважды и не пропадёт из неё
+    rows = aggregate_sales(OrderItem.objects.all(), days).union(
+        aggregate_sales(ArchivedOrderItem.objects.all(), days),
+        all=True,
+    )
+    totals = {}
+    for row in rows:
+        key = (row['day'], row['order__assigned_restaurant'], row['product'])
+        quantity, revenue = totals.get(key, (0, 0))
+        totals[key] = (quantity + row['sold'], revenue + row['earned'])
+    return [
+        DailySales(
+            day=day,
+            restaurant_id=restaurant_id,
+            product_id=product_id,
+            quantity=quantity,
+            revenue=revenue,
+        )
+        for (day, restaurant_id, product_id), (quantity, revenue) in totals.items()
+    ]
+
+
+def get_rollup_since():
+    """С какого момента следующий пересчёт будет искать изменения."""
+    watermark = RollupWatermark.objects.filter(name=SALES_ROLLUP).first()
+    if watermark is None:
+        return None
+    return watermark.value - timedelta(seconds=settings.SALES_ROLLUP_OVERLAP)
+
+
+def get_changed_days(since):
+    """Дни, в которых с `since` менялись или удалялись заказы."""
+    changed = (
+        Order.objects
+        .filter(updated_at__gte=since)
+        .annotate(day=TruncDate('date_registration'))
+        .values_list('day', flat=True)
+        .distinct()
+    )
+    deleted = (
+        DeletedOrder.objects
+        .filter(deleted_at__gte=since, date_registration__isnull=False)
+        .annotate(day=TruncDate('date_registration'))
+        .values_list('day', flat=True)
+        .distinct()
+    )
+    return set(changed) | set(deleted)
+
+
+def get_all_days():
+    days = set()
+    for orders in (Order.objects.filter(status='DONE'), ArchivedOrder.objects.all()):
+        days |= set(
+            orders
+            .annotate(day=TruncDate('date_registration'))
+            .values_list('day', flat=True)
+            .distinct()
+        )
+    return days
+
+
+def refresh_daily_sales(rebuild=False, chunk_days=31):
+    """Пересчитывает `DailySales` за дни, где менялись заказы.
+
+    Изменившиеся заказы ищутся по `updated_at`, удалённые — по отметкам
+    `DeletedOrder` после отметки прошлого запуска, с запасом
+    `SALES_ROLLUP_OVERLAP` секунд на долгие транзакции.
+    Каждый затронутый день пересчитывается целиком по рабочим и архивным
+    заказам, так что повторный пересчёт ничего не испортит. При первом
+    запуске и с `rebuild=True` таблица строится заново. Возвращает число
+    пересчитанных дней.
+    """
+    started_at = timezone.now()
+    since = get_rollup_since()
+    rebuild = rebuild or since is None
+
+    with transaction.atomic():
+        if rebuild:
+            DailySales.objects.all().delete()
+            days = get_all_days()
+        else:
+            days = get_changed_days(since)
+
+        days = sorted(days)
+        for offset in range(0, len(days), chunk_days):
+            chunk = days[offset:offset + chunk_days]
+            if not rebuild:
+                DailySales.objects.filter(day__in=chunk).delete()
+            DailySales.objects.bulk_create(build_daily_sales(chunk), batch_size=1000)
+
+        RollupWatermark.objects.update_or_create(
+            name=SALES_ROLLUP,
+            defaults={'value': started_at},
+        )
+    return len(days)
+
+
+def get_sales_report(date_from, date_to, group_by):
+    """Продажи за период из `DailySales`, сгруппированные по `group_by`."""
+    fields = REPORT_GROUPS[group_by]
+    sales = DailySales.objects.filter(day__gte=date_from, day__lte=date_to)
+    rows = (
+        sales
+        .values(*fields)
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by(*(['day'] if group_by == 'day' else ['-revenue']))
+    )
+    totals = sales.aggregate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+    return list(rows), {
+        'quantity': totals['quantity'] or 0,
+        'revenue': totals['revenue'] or 0,
+    }
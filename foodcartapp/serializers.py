@@ -1,15 +1,18 @@
-import logging
-
 from django.db import transaction
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from phonenumber_field.serializerfields import PhoneNumberField
-from rest_framework.serializers import ModelSerializer, ValidationError
-
-from .models import GeocodeData, Order, OrderItem
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import (BooleanField, CharField, IntegerField,
+                                        ModelSerializer, Serializer,
+                                        ValidationError)
 
-logger = logging.getLogger(__name__)
+from .models import Order, OrderItem, Product, Restaurant
 
 
 class OrderItemSerializer(ModelSerializer):
+    product = IntegerField()
+
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
@@ -33,29 +36,99 @@ class OrderSerializer(ModelSerializer):
             'products'
         ]
 
+    def validate_products(self, products_data):
+        products = Product.objects.only('id', 'price').in_bulk(
+            {product_data['product'] for product_data in products_data}
+        )
+        does_not_exist = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        errors = [
+            {} if product_data['product'] in products
+            else {'product': [does_not_exist.format(pk_value=product_data['product'])]}
+            for product_data in products_data
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+
+        for product_data in products_data:
+            product_data['product'] = products[product_data['product']]
+        return products_data
+
     @transaction.atomic
     def create(self, validated_data):
         products_data = validated_data.pop('products')
 
-        lat, lon = GeocodeData.objects.fetch_coordinates(validated_data['address'])
-        if lat is None or lon is None:
-            logger.warning("Could not determine the coordinates for the given address: %s", validated_data['address'])
-
-        validated_data['latitude'] = lat
-        validated_data['longitude'] = lon
-
-        order = Order.objects.create(**validated_data)
-        for product_data in products_data:
-            product = product_data['product']
-            OrderItem.objects.create(
+        order = Order.objects.create(
+            total_price=sum(
+                product_data['product'].price * product_data['quantity']
+                for product_data in products_data
+            ),
+            **validated_data
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                price=product.price,
+                price=product_data['product'].price,
                 **product_data
             )
+            for product_data in products_data
+        ])
         return order
 
 
 class ReadOrderSerializer(ModelSerializer):
     class Meta:
         model = Order
-        fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address']
\ No newline at end of file
+        fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address']
+
+
+class ProductFilterSerializer(Serializer):
+    category = IntegerField(required=False)
+    restaurant = IntegerField(required=False)
+    special_status = BooleanField(required=False, allow_null=True)
+    cursor = CharField(required=False)
+    limit = IntegerField(required=False, min_value=1, max_value=500, default=100)
+    stream = BooleanField(required=False, default=False)
+
+    @staticmethod
+    def encode_cursor(product_id):
+        return urlsafe_base64_encode(force_bytes(product_id))
+
+    def validate_cursor(self, cursor):
+        try:
+            return int(force_str(urlsafe_base64_decode(cursor)))
+        except ValueError:
+            raise ValidationError('Некорректный курсор.')
+
+
+class MenuAvailabilityChangeSerializer(Serializer):
+    restaurant = IntegerField()
+    product = IntegerField()
+    availability = BooleanField()
+
+
+class MenuAvailabilitySerializer(Serializer):
+    changes = MenuAvailabilityChangeSerializer(many=True, allow_empty=False)
+
+    def validate_changes(self, changes):
+        restaurant_ids = set(
+            Restaurant.objects
+            .filter(id__in={change['restaurant'] for change in changes})
+            .values_list('id', flat=True)
+        )
+        product_ids = set(
+            Product.objects
+            .filter(id__in={change['product'] for change in changes})
+            .values_list('id', flat=True)
+        )
+        does_not_exist = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        errors = []
+        for change in changes:
+            error = {}
+            if change['restaurant'] not in restaurant_ids:
+                error['restaurant'] = [does_not_exist.format(pk_value=change['restaurant'])]
+            if change['product'] not in product_ids:
+                error['product'] = [does_not_exist.format(pk_value=change['product'])]
+            errors.append(error)
+        if any(errors):
+            raise ValidationError(errors)
+        return changes
@@ -0,0 +1,140 @@
+import threading
+from copy import copy
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .catalogue import invalidate_catalogue
+from .menu_index import menu_index
+from .rollups import get_rollup_since
+from .spatial import restaurant_index
+from .thumbnails import generate_thumbnails_safely, has_thumbnails
+from .models import (DeletedOrder, Order, OrderItem, Product, ProductCategory,
+                     Restaurant, RestaurantMenuItem, is_deleting_orders,
+                     refresh_open_orders_candidates)
+
+# Пачка изменений меню целиком, аргумент `items` — изменённые пункты меню.
+# Отправляется один раз после коммита, вместо сигналов по каждой строке.
+menu_changed = Signal()
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def update_menu_index(sender, instance, **kwargs):
+    item = copy(instance)
+    transaction.on_commit(lambda: menu_index.update_item(item))
+    schedule_once(menu_index.publish)
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def remove_from_menu_index(sender, instance, **kwargs):
+    # Копия нужна, потому что после удаления Django обнуляет id объекта
+    item = copy(instance)
+    transaction.on_commit(lambda: menu_index.remove_item(item))
+    schedule_once(menu_index.publish)
+
+
+@receiver(post_delete, sender=Restaurant)
+def drop_restaurant_from_menu_index(sender, **kwargs):
+    transaction.on_commit(menu_index.invalidate)
+    schedule_once(menu_index.publish)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def reset_catalogue_cache(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(post_save, sender=Product)
+def make_product_thumbnails(sender, instance, **kwargs):
+    if not instance.image or has_thumbnails(instance):
+        return
+    thumbnails = generate_thumbnails_safely(instance.image.name)
+    if thumbnails:
+        instance.thumbnails = thumbnails
+        Product.objects.filter(id=instance.id).update(thumbnails=thumbnails)
+        invalidate_catalogue()
+
+
+# Номер последней регистрации каждой функции из `schedule_once` в этом потоке
+_registrations = threading.local()
+
+
+def schedule_once(func):
+    """Вызывает `func` после коммита, но не больше раза на транзакцию.
+
+    Каждый вызов регистрирует свой обработчик `on_commit`, а функцию
+    выполняет только последний из них. Так она отрабатывает после всех
+    обработчиков, которые транзакция зарегистрировала до неё, например
+    после обновления индекса меню по каждому сохранённому пункту.
+    Обработчики откаченной транзакции Django просто выбрасывает.
+    """
+    if not hasattr(_registrations, 'latest'):
+        _registrations.latest = {}
+    number = _registrations.latest.get(func, 0) + 1
+    _registrations.latest[func] = number
+
+    def run():
+        if _registrations.latest.get(func) == number:
+            func()
+
+    transaction.on_commit(run)
+
+
+def schedule_candidates_refresh():
+    """Пересчитывает рестораны открытых заказов один раз после коммита."""
+    schedule_once(refresh_open_orders_candidates)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def reset_restaurant_index(sender, **kwargs):
+    transaction.on_commit(restaurant_index.invalidate)
+    schedule_candidates_refresh()
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def refresh_order_candidates(sender, **kwargs):
+    schedule_candidates_refresh()
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_total_price(sender, instance, **kwargs):
+    # Позиции удаляются каскадом вместе с заказом, пересчитывать нечего
+    if is_deleting_orders():
+        return
+    Order.objects.filter(id=instance.order_id).refresh_total_prices()
+
+
+@receiver(post_delete, sender=Order)
+def mark_order_deleted(sender, instance, **kwargs):
+    now = timezone.now()
+    DeletedOrder.objects.create(
+        order_id=instance.id,
+        date_registration=instance.date_registration,
+        deleted_at=now,
+    )
+    # Отметки, которые ещё не видел пересчёт продаж, не трогаем
+    cutoff = now - timedelta(seconds=settings.ORDERS_BOARD_DELETED_TTL)
+    rolled_up_until = get_rollup_since()
+    if rolled_up_until is not None:
+        cutoff = min(cutoff, rolled_up_until)
+    DeletedOrder.objects.filter(deleted_at__lt=cutoff).delete()
+
+
+@receiver(menu_changed)
+def apply_menu_changes(sender, items, **kwargs):
+    menu_index.update_items(items)
+    menu_index.publish()
+    invalidate_catalogue()
+    schedule_candidates_refresh()
@@ -0,0 +1,165 @@
+import math
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .distances import RestaurantDistance, distance_matrix
+
+KM_PER_DEGREE = 111.32
+
+
+class RestaurantSpatialIndex:
+    """Сетка по координатам ресторанов для поиска ближайших.
+
+    Рестораны раскладываются по ячейкам размером `SPATIAL_INDEX_CELL_KM`.
+    Запрос «k ближайших в радиусе R» смотрит только ячейки, которые
+    накрывает круг радиуса R, и считает расстояния лишь до ресторанов
+    в них. У каждого ресторана свой радиус доставки: ресторан попадает
+    в выдачу, только если точка лежит внутри его радиуса.
+
+    Индекс строится лениво, сбрасывается сигналами по `Restaurant`
+    и перестраивается раз в `SPATIAL_INDEX_TTL` секунд, чтобы подтянуть
+    правки из других процессов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = None
+
+    def invalidate(self):
+        self._built_at = None
+
+    def build(self):
+        from .models import Restaurant
+
+        cell_size = settings.SPATIAL_INDEX_CELL_KM / KM_PER_DEGREE
+        rows = Restaurant.objects.values_list(
+            'id', 'name', 'latitude', 'longitude', 'delivery_radius')
+
+        located = []
+        unlocated = []
+        for row in rows:
+            if row[2] is None or row[3] is None:
+                unlocated.append(RestaurantDistance(row[0], row[1], None))
+            else:
+                located.append(row)
+
+        points = np.array(
+            [(float(row[2]), float(row[3])) for row in located],
+            dtype=float,
+        ).reshape(-1, 2)
+        cells = defaultdict(list)
+        for position, (latitude, longitude) in enumerate(points):
+            cells[self._cell(latitude, longitude, cell_size)].append(position)
+
+        with self._lock:
+            self._cell_size = cell_size
+            self._ids = [row[0] for row in located]
+            self._names = [row[1] for row in located]
+            self._points = points
+            self._radii = np.array([float(row[4]) for row in located], dtype=float)
+            self._max_radius = float(self._radii.max()) if located else 0
+            self._cells = {cell: np.array(positions) for cell, positions in cells.items()}
+            self._unlocated = unlocated
+            self._built_at = time.monotonic()
+
+    def ensure_built(self):
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > settings.SPATIAL_INDEX_TTL:
+            self.build()
+
+    @staticmethod
+    def _cell(latitude, longitude, cell_size):
+        return math.floor(latitude / cell_size), math.floor(longitude / cell_size)
+
+    def _candidate_positions(self, latitude, longitude, radius_km):
+        cell_size = self._cell_size
+        lat_delta = radius_km / KM_PER_DEGREE
+        lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        min_row, min_column = self._cell(latitude - lat_delta, longitude - lon_delta, cell_size)
+        max_row, max_column = self._cell(latitude + lat_delta, longitude + lon_delta, cell_size)
+
+        covered_cells = (max_row - min_row + 1) * (max_column - min_column + 1)
+        if covered_cells > len(self._cells):
+            positions = [
+                cell_positions for (row, column), cell_positions in self._cells.items()
+                if min_row <= row <= max_row and min_column <= column <= max_column
+            ]
+        else:
+            positions = [
+                self._cells[(row, column)]
+                for row in range(min_row, max_row + 1)
+                for column in range(min_column, max_column + 1)
+                if (row, column) in self._cells
+            ]
+        if not positions:
+            return np.array([], dtype=int)
+        return np.concatenate(positions)
+
+    def nearest(self, latitude, longitude, k=None, radius_km=None,
+                eligible_ids=None, mode=None):
+        """Возвращает до `k` ближайших ресторанов, которые доставят в точку.
+
+        Результат — список `RestaurantDistance`, отсортированный по
+        расстоянию. `radius_km` дополнительно ограничивает поиск,
+        `eligible_ids` оставляет только перечисленные рестораны.
+        """
+        self.ensure_built()
+        with self._lock:
+            search_radius = self._max_radius
+            if radius_km is not None:
+                search_radius = min(search_radius, radius_km)
+            positions = self._candidate_positions(
+                float(latitude), float(longitude), search_radius)
+            if eligible_ids is not None and len(positions):
+                ids = self._ids
+                positions = np.array(
+                    [position for position in positions if ids[position] in eligible_ids],
+                    dtype=int,
+                )
+            if not len(positions):
+                return []
+
+            distances = distance_matrix(
+                [(float(latitude), float(longitude))],
+                self._points[positions],
+                mode=mode,
+            )[0]
+            reachable = distances <= self._radii[positions]
+            if radius_km is not None:
+                reachable &= distances <= radius_km
+            positions = positions[reachable]
+            distances = distances[reachable]
+
+            ordering = np.argsort(distances, kind='stable')[:k]
+            return [
+                RestaurantDistance(
+                    self._ids[positions[index]],
+                    self._names[positions[index]],
+                    float(distances[index]),
+                )
+                for index in ordering
+            ]
+
+    def located(self, eligible_ids=None):
+        """Рестораны с координатами, когда не от чего считать расстояние."""
+        self.ensure_built()
+        return [
+            RestaurantDistance(restaurant_id, name, None)
+            for restaurant_id, name in zip(self._ids, self._names)
+            if eligible_ids is None or restaurant_id in eligible_ids
+        ]
+
+    def unlocated(self, eligible_ids=None):
+        """Рестораны без координат: расстояние до них неизвестно."""
+        self.ensure_built()
+        return [
+            restaurant for restaurant in self._unlocated
+            if eligible_ids is None or restaurant.restaurant_id in eligible_ids
+        ]
+
+
+restaurant_index = RestaurantSpatialIndex()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MOSCOW_CENTER = (55.751244, 37.618423)
+
+
+def fake_coordinates(address):
+    digest = hashlib.md5(address.encode()).digest()
+    lat = MOSCOW_CENTER[0] + (digest[0] - 128) / 512
+    lon = MOSCOW_CENTER[1] + (digest[1] - 128) / 512
+    return round(lat, 6), round(lon, 6)
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        address = parse_qs(urlparse(self.path).query).get('geocode', [''])[0]
+        with server.lock:
+            server.calls += 1
+        if server.delay:
+            time.sleep(server.delay)
+
+        if address.startswith(server.error_prefix):
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        found_places = []
+        if address and not address.startswith(server.unknown_prefix):
+            lat, lon = fake_coordinates(address)
+            found_places.append({'GeoObject': {'Point': {'pos': f'{lon} {lat}'}}})
+        body = json.dumps({
+            'response': {'GeoObjectCollection': {'featureMember': found_places}}
+        }).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGeocoder:
+    """Локальный HTTP-сервер, отвечающий в формате Яндекс геокодера.
+
+    Координаты выдумываются из хэша адреса, так что один и тот же адрес
+    всегда попадает в одну точку около центра Москвы. Адреса, которые
+    начинаются с `unknown_prefix`, «не находятся», а на адреса
+    с `error_prefix` сервер отвечает ошибкой 503.
+
+        with StubGeocoder(delay=0.2) as stub:
+            with override_settings(YANDEX_GEOCODER_URL=stub.url):
+                ...
+    """
+
+    def __init__(self, delay=0.0, unknown_prefix='nowhere', error_prefix='broken',
+                 host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), StubGeocoderHandler)
+        self.server.daemon_threads = True
+        self.server.delay = delay
+        self.server.unknown_prefix = unknown_prefix
+        self.server.error_prefix = error_prefix
+        self.server.calls = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/1.x'
+
+    @property
+    def calls(self):
+        return self.server.calls
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,810 @@
+import json
+import random
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import geocoder
+from .archive import archive_batch, delete_rows, get_archivable_orders
+from .availability import set_menu_availability
+from .dispatch import assign_orders, dispatch_new_orders
+from .distances import distance_matrix
+from .geocache import NOT_FOUND, geocode_cache
+from .menu_index import menu_index
+from .models import (ArchivedOrder, ArchivedOrderItem, DailySales,
+                     DeletedOrder, GeocodeData, Order, OrderItem, Product, Restaurant,
+                     RestaurantMenuItem)
+from .rollups import get_sales_report, refresh_daily_sales
+from .spatial import restaurant_index
+from .signals import schedule_once
+from .stub_geocoder import StubGeocoder, fake_coordinates
+
+
+@override_settings(ORDER_API_ASYNC=False)
+class RegisterOrderQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(
+            Product(name=f'Бургер {number}', price=100 + number, image='burger.jpg')
+            for number in range(100)
+        )
+        cls.products = list(Product.objects.order_by('id'))
+
+    def register_order(self, products):
+        return self.client.post('/api/order/', {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Тверская улица, 1',
+            'products': [
+                {'product': product.id, 'quantity': 2}
+                for product in products
+            ],
+        }, content_type='application/json')
+
+    def test_query_count_does_not_grow_with_items(self):
+        # Товары, заказ и его позиции — три запроса. Транзакция заказа
+        # внутри TestCase — это SAVEPOINT и RELEASE, отсюда ещё два
+        for size in [1, 10, 100]:
+            with self.subTest(size=size):
+                with self.assertNumQueries(5):
+                    response = self.register_order(self.products[:size])
+                self.assertEqual(response.status_code, 200)
+                order = Order.objects.get(id=response.json()['id'])
+                self.assertEqual(OrderItem.objects.filter(order=order).count(), size)
+                self.assertEqual(
+                    order.total_price,
+                    sum(product.price * 2 for product in self.products[:size]),
+                )
+
+
+class GeocodeOrdersTest(TestCase):
+    def setUp(self):
+        geocode_cache.local.clear()
+        self.addCleanup(geocode_cache.local.clear)
+        self.stub = StubGeocoder().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(YANDEX_GEOCODER_URL=self.stub.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_order(self, address):
+        return Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address=address,
+        )
+
+    def geocode_orders(self):
+        call_command('geocode_orders', '--once', stdout=StringIO())
+
+    def test_found_address_gets_coordinates(self):
+        order = self.create_order('Москва, Тверская улица, 1')
+        self.geocode_orders()
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.DONE)
+        lat, lon = fake_coordinates('Москва, Тверская улица, 1')
+        self.assertAlmostEqual(float(order.latitude), lat)
+        self.assertAlmostEqual(float(order.longitude), lon)
+        self.assertEqual(order.candidate_restaurants, [])
+        self.assertTrue(GeocodeData.objects.filter(address='москва тверская улица 1').exists())
+
+    def test_unknown_address_fails(self):
+        order = self.create_order('nowhere, 13')
+        self.geocode_orders()
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.FAILED)
+        self.assertIsNone(order.latitude)
+        self.assertEqual(order.candidate_restaurants, [])
+        self.assertFalse(GeocodeData.objects.exists())
+
+    def test_geocoder_error_postpones_order(self):
+        order = self.create_order('broken, 1')
+        self.geocode_orders()
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.PENDING)
+        self.assertEqual(order.geocoding_attempts, 1)
+        self.assertGreater(order.geocoding_retry_at, timezone.now())
+
+        calls = self.stub.calls
+        self.geocode_orders()
+        self.assertEqual(self.stub.calls, calls)
+
+    @override_settings(GEOCODE_MAX_ATTEMPTS=2, GEOCODE_RETRY_DELAY=0)
+    def test_geocoder_error_fails_after_max_attempts(self):
+        order = self.create_order('broken, 1')
+        self.geocode_orders()
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.FAILED)
+        self.assertEqual(order.geocoding_attempts, 2)
+
+    def test_postponed_orders_do_not_block_queue(self):
+        for number in range(3):
+            self.create_order(f'broken, {number}')
+        order = self.create_order('Москва, Тверская улица, 1')
+        call_command('geocode_orders', '--once', '--batch-size', '2', stdout=StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.DONE)
+
+    def test_row_saved_under_raw_address_is_reused(self):
+        GeocodeData.objects.create(
+            address='Москва, Тверская улица, 1', latitude='55.757', longitude='37.613')
+
+        resolved = GeocodeData.objects.resolve(['Москва, Тверская улица, 1'])
+
+        self.assertEqual(self.stub.calls, 0)
+        self.assertEqual(
+            [float(value) for value in resolved['Москва, Тверская улица, 1']],
+            [55.757, 37.613],
+        )
+        self.assertTrue(GeocodeData.objects.filter(address='москва тверская улица 1').exists())
+
+    def test_malformed_answer_is_geocoder_error(self):
+        response = mock.Mock()
+        response.json.return_value = {
+            'response': {'GeoObjectCollection': {'featureMember': [{'GeoObject': {}}]}},
+        }
+        session = mock.Mock()
+        session.get.return_value = response
+
+        with self.assertRaises(geocoder.GeocoderError):
+            geocoder.fetch_coordinates('Москва', session=session)
+
+    def test_same_address_is_served_from_cache(self):
+        self.create_order('Москва, Тверская улица, 1')
+        self.geocode_orders()
+        GeocodeData.objects.all().delete()
+
+        order = self.create_order('москва  тверская улица 1')
+        self.geocode_orders()
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.DONE)
+        self.assertEqual(self.stub.calls, 1)
+        self.assertGreaterEqual(geocode_cache.stats()['hits'], 1)
+
+    def test_unknown_address_is_cached_for_negative_ttl(self):
+        self.create_order('nowhere, 13')
+        self.geocode_orders()
+        order = self.create_order('nowhere, 13')
+        self.geocode_orders()
+
+        order.refresh_from_db()
+        self.assertEqual(order.geocoding_status, Order.GeocodingStatus.FAILED)
+        self.assertEqual(self.stub.calls, 1)
+
+    @override_settings(GEOCODE_CACHE_NEGATIVE_TTL=0)
+    def test_unknown_address_is_asked_again_after_negative_ttl(self):
+        self.create_order('nowhere, 13')
+        self.geocode_orders()
+        self.create_order('nowhere, 13')
+        self.geocode_orders()
+
+        self.assertEqual(self.stub.calls, 2)
+        self.assertGreaterEqual(geocode_cache.stats()['expirations'], 1)
+
+
+@override_settings(GEOCODE_CACHE_ALIAS='default')
+class GeocodeCacheTest(TestCase):
+    def setUp(self):
+        geocode_cache.local.clear()
+        self.addCleanup(geocode_cache.local.clear)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def test_shared_hit_is_promoted_to_local_cache(self):
+        caches['default'].set('geocode:москва', ('55.75', '37.61'), None)
+
+        self.assertEqual(geocode_cache.get('москва'), (True, ('55.75', '37.61')))
+        self.assertEqual(geocode_cache.local.get('москва'), ('55.75', '37.61'))
+
+    @override_settings(GEOCODE_CACHE_NEGATIVE_TTL=0)
+    def test_shared_negative_hit_keeps_negative_ttl(self):
+        caches['default'].set('geocode:nowhere', NOT_FOUND, None)
+        expirations = geocode_cache.local.expirations
+
+        self.assertEqual(geocode_cache.get('nowhere'), (True, None))
+        self.assertIsNone(geocode_cache.local.get('nowhere'))
+        self.assertEqual(geocode_cache.local.expirations, expirations + 1)
+
+
+class OrderTotalPriceTest(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+        )
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.items = [
+            OrderItem.objects.create(order=self.order, product=product, quantity=1, price=100)
+            for _ in range(3)
+        ]
+
+    def assertNoUpdates(self, delete):
+        with CaptureQueriesContext(connection) as queries:
+            delete()
+        self.assertEqual(
+            [query['sql'] for query in queries if query['sql'].startswith('UPDATE')], [])
+
+    def test_deleted_item_refreshes_total(self):
+        self.items[0].delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 200)
+
+    def test_deleted_order_does_not_refresh_total(self):
+        self.assertNoUpdates(self.order.delete)
+
+    def test_deleted_orders_queryset_does_not_refresh_total(self):
+        self.assertNoUpdates(Order.objects.filter(id=self.order.id).delete)
+
+
+class CatalogueTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        for index in [menu_index, restaurant_index]:
+            index.invalidate()
+            self.addCleanup(index.invalidate)
+        self.restaurant = Restaurant.objects.create(name='Бургерная', address='Москва')
+        self.burger, self.fries = [
+            Product.objects.create(name=name, price=100, image='burger.jpg')
+            for name in ['Бургер', 'Картошка']
+        ]
+        RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.burger)
+
+    def get_catalogue(self, **headers):
+        return self.client.get('/api/products/', **headers)
+
+    def names(self, response):
+        return [product['name'] for product in response.json()]
+
+    def test_only_available_products_are_listed(self):
+        self.assertEqual(self.names(self.get_catalogue()), ['Бургер'])
+
+    def test_repeated_request_is_served_from_cache(self):
+        etag = self.get_catalogue()['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get_catalogue()
+
+        self.assertEqual(response['ETag'], etag)
+
+    def test_matching_etag_gets_not_modified(self):
+        etag = self.get_catalogue()['ETag']
+
+        response = self.get_catalogue(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_product_change_resets_catalogue(self):
+        etag = self.get_catalogue()['ETag']
+        self.burger.price = 150
+        self.burger.save()
+
+        response = self.get_catalogue(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['price'], 150)
+
+    def test_menu_changes_reset_catalogue(self):
+        self.get_catalogue()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_menu_availability([
+                {'restaurant': self.restaurant.id, 'product': self.fries.id, 'availability': True},
+            ])
+
+        self.assertEqual(self.names(self.get_catalogue()), ['Бургер', 'Картошка'])
+
+
+class ProductFiltersTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.restaurant, self.other_restaurant = [
+            Restaurant.objects.create(name=name, address='Москва')
+            for name in ['Бургерная', 'Закусочная']
+        ]
+        self.products = [
+            Product.objects.create(
+                name=f'Бургер {number}', price=100, image='burger.jpg',
+                special_status=number % 2 == 0,
+            )
+            for number in range(5)
+        ]
+        for product in self.products:
+            RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=product)
+        RestaurantMenuItem.objects.create(
+            restaurant=self.other_restaurant, product=self.products[0], availability=False)
+
+    def get_products(self, url='/api/products/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def ids(self, products):
+        return [product['id'] for product in products]
+
+    def test_pages_follow_cursor(self):
+        response = self.get_products(limit=2)
+        seen = []
+        while True:
+            page = response.json()
+            seen += self.ids(page['results'])
+            if not page['next']:
+                break
+            self.assertLessEqual(len(page['results']), 2)
+            response = self.get_products(page['next'])
+
+        self.assertEqual(seen, [product.id for product in self.products])
+
+    def test_filters_are_combined(self):
+        response = self.get_products(special_status='true', limit=100)
+        self.assertEqual(
+            self.ids(response.json()['results']),
+            [product.id for product in self.products[::2]],
+        )
+        response = self.get_products(restaurant=self.other_restaurant.id)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get('/api/products/', {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_returns_every_product(self):
+        response = self.get_products(stream='true')
+        products = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(self.ids(products), [product.id for product in self.products])
+
+
+class SpatialIndexTest(TestCase):
+    def setUp(self):
+        restaurant_index.invalidate()
+        self.addCleanup(restaurant_index.invalidate)
+        generator = random.Random(13)
+        Restaurant.objects.bulk_create(
+            Restaurant(
+                name=f'Ресторан {number}',
+                address='Москва',
+                latitude=round(generator.uniform(55.6, 55.9), 6),
+                longitude=round(generator.uniform(37.4, 37.8), 6),
+                delivery_radius=round(generator.uniform(1, 15), 2),
+            )
+            for number in range(60)
+        )
+        self.restaurants = list(Restaurant.objects.order_by('id'))
+        self.points = [
+            (generator.uniform(55.6, 55.9), generator.uniform(37.4, 37.8))
+            for _ in range(20)
+        ]
+
+    def brute_force(self, latitude, longitude, radius_km=None):
+        distances = distance_matrix(
+            [(latitude, longitude)],
+            [(float(restaurant.latitude), float(restaurant.longitude))
+             for restaurant in self.restaurants],
+        )[0]
+        reachable = [
+            (distance, restaurant.id)
+            for restaurant, distance in zip(self.restaurants, distances)
+            if distance <= float(restaurant.delivery_radius)
+            and (radius_km is None or distance <= radius_km)
+        ]
+        return [restaurant_id for _, restaurant_id in sorted(reachable)]
+
+    def nearest_ids(self, *args, **kwargs):
+        return [
+            restaurant.restaurant_id
+            for restaurant in restaurant_index.nearest(*args, **kwargs)
+        ]
+
+    @override_settings(SPATIAL_INDEX_CELL_KM=2)
+    def test_matches_brute_force(self):
+        for latitude, longitude in self.points:
+            with self.subTest(point=(latitude, longitude)):
+                expected = self.brute_force(latitude, longitude)
+                self.assertEqual(self.nearest_ids(latitude, longitude), expected)
+                self.assertEqual(self.nearest_ids(latitude, longitude, k=3), expected[:3])
+                self.assertEqual(
+                    self.nearest_ids(latitude, longitude, radius_km=3),
+                    self.brute_force(latitude, longitude, radius_km=3),
+                )
+
+    def test_eligible_ids_limit_results(self):
+        latitude, longitude = self.points[0]
+        expected = self.brute_force(latitude, longitude)
+        eligible_ids = set(expected[::2])
+
+        self.assertEqual(
+            self.nearest_ids(latitude, longitude, eligible_ids=eligible_ids),
+            expected[::2],
+        )
+
+    def test_restaurant_without_coordinates_is_unlocated(self):
+        restaurant = Restaurant.objects.create(name='Без адреса', address='Москва')
+        restaurant_index.invalidate()
+
+        self.assertEqual(
+            [item.restaurant_id for item in restaurant_index.unlocated()], [restaurant.id])
+        self.assertNotIn(restaurant.id, self.nearest_ids(*self.points[0]))
+
+    def test_saved_restaurant_resets_index(self):
+        latitude, longitude = self.points[0]
+        restaurant = self.restaurants[0]
+        restaurant_index.ensure_built()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.latitude = round(latitude, 6)
+            restaurant.longitude = round(longitude, 6)
+            restaurant.save()
+
+        self.assertEqual(self.nearest_ids(latitude, longitude)[0], restaurant.id)
+
+
+class AssignOrdersTest(TestCase):
+    def test_nearest_free_restaurant_is_chosen(self):
+        candidates = {1: [(10, 3.0), (20, 1.0)], 2: [(10, 2.0)]}
+        self.assertEqual(assign_orders(candidates, {10: 5, 20: 5}), {1: 20, 2: 10})
+
+    def test_full_restaurant_order_moves_to_free_one(self):
+        # Жадный проход отдаст ресторан 10 заказу 1, и заказу 2 не хватит
+        # места. Починка пересадит заказ 1 в ресторан 20
+        candidates = {1: [(10, 1.0), (20, 2.0)], 2: [(10, 1.5)]}
+        self.assertEqual(assign_orders(candidates, {10: 1, 20: 1}), {1: 20, 2: 10})
+
+    def test_capacities_are_respected(self):
+        generator = random.Random(14)
+        candidates = {
+            order_id: [
+                (restaurant_id, generator.uniform(0, 10))
+                for restaurant_id in generator.sample(range(10), 4)
+            ]
+            for order_id in range(100)
+        }
+        capacities = {restaurant_id: 5 for restaurant_id in range(10)}
+
+        assignment = assign_orders(candidates, capacities)
+
+        self.assertEqual(len(assignment), 50)
+        for order_id, restaurant_id in assignment.items():
+            self.assertIn(restaurant_id, dict(candidates[order_id]))
+        loads = [list(assignment.values()).count(restaurant_id) for restaurant_id in capacities]
+        self.assertTrue(all(load <= 5 for load in loads))
+
+    def test_unknown_distance_is_skipped(self):
+        self.assertEqual(assign_orders({1: [(10, None)]}, {10: 1}), {})
+
+
+class DispatchNewOrdersTest(TestCase):
+    def setUp(self):
+        self.near, self.far = [
+            Restaurant.objects.create(name=name, address='Москва', capacity=1)
+            for name in ['Ближний', 'Дальний']
+        ]
+
+    def create_order(self, distances=None, **fields):
+        return Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+            candidate_restaurants=[
+                {'restaurant_id': restaurant.id, 'name': restaurant.name, 'distance': distance}
+                for restaurant, distance in (distances or {}).items()
+            ],
+            **fields,
+        )
+
+    def assigned(self, order):
+        order.refresh_from_db()
+        return order.assigned_restaurant_id
+
+    def test_busy_restaurant_gets_no_new_orders(self):
+        self.create_order(status='IN_PROGRESS', assigned_restaurant=self.near)
+        order = self.create_order({self.near: 1, self.far: 5})
+
+        assignment, distance = dispatch_new_orders()
+
+        self.assertEqual(assignment, {order.id: self.far.id})
+        self.assertEqual(distance, 5)
+        self.assertEqual(self.assigned(order), self.far.id)
+
+    def test_dry_run_writes_nothing(self):
+        order = self.create_order({self.near: 1})
+
+        assignment, _ = dispatch_new_orders(dry_run=True)
+
+        self.assertEqual(assignment, {order.id: self.near.id})
+        self.assertIsNone(self.assigned(order))
+
+
+class QueryPlansTest(TestCase):
+    def test_hot_queries_do_not_scan_orders(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        for status in ['NEW', 'DONE']:
+            order = Order.objects.create(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79001234567',
+                address='Москва, Тверская улица, 1',
+                status=status,
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+
+        # На паре строк PostgreSQL честно выбирает последовательное чтение,
+        # так что проверяем, что индекс для запроса вообще есть
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        call_command('check_query_plans', stdout=StringIO())
+
+
+class ScheduleOnceTest(TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def record(self):
+        self.calls.append(list(self.hooks))
+
+    def test_runs_once_after_hooks_registered_before_it(self):
+        self.hooks = []
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for number in range(3):
+                    transaction.on_commit(lambda number=number: self.hooks.append(number))
+                    schedule_once(self.record)
+
+        self.assertEqual(self.calls, [[0, 1, 2]])
+
+    def test_rolled_back_transaction_does_not_block_next_one(self):
+        self.hooks = []
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    schedule_once(self.record)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                schedule_once(self.record)
+
+        self.assertEqual(self.calls, [[]])
+
+
+class MenuIndexSignalsTest(TestCase):
+    def setUp(self):
+        for index in [menu_index, restaurant_index]:
+            index.invalidate()
+            self.addCleanup(index.invalidate)
+        self.restaurant = Restaurant.objects.create(name='Бургерная', address='Москва')
+        self.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(2)
+        ]
+        self.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+        )
+        for product in self.products:
+            OrderItem.objects.create(order=self.order, product=product, quantity=1, price=100)
+        menu_index.build()
+
+    def save_menu(self, availability=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for product in self.products:
+                    RestaurantMenuItem.objects.update_or_create(
+                        restaurant=self.restaurant,
+                        product=product,
+                        defaults={'availability': availability},
+                    )
+
+    def test_items_saved_in_one_transaction_reach_order_candidates(self):
+        self.save_menu()
+
+        product_ids = [product.id for product in self.products]
+        self.assertEqual(menu_index.eligible_restaurant_ids(product_ids), {self.restaurant.id})
+        self.order.refresh_from_db()
+        self.assertEqual(
+            [restaurant['restaurant_id'] for restaurant in self.order.candidate_restaurants],
+            [self.restaurant.id],
+        )
+
+    def test_rolled_back_items_do_not_reach_index(self):
+        try:
+            with transaction.atomic():
+                RestaurantMenuItem.objects.create(
+                    restaurant=self.restaurant, product=self.products[0])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(menu_index.eligible_restaurant_ids([self.products[0].id]), set())
+
+    def test_deleted_restaurant_leaves_index(self):
+        self.save_menu()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.delete()
+
+        self.assertEqual(menu_index.eligible_restaurant_ids([]), set())
+
+
+class DailySalesTest(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='Бургерная', address='Москва')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def create_order(self, quantity, status='DONE', product=None):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+            status=status,
+            assigned_restaurant=self.restaurant,
+        )
+        OrderItem.objects.create(
+            order=order, product=product or self.product, quantity=quantity, price=100)
+        return order
+
+    def totals(self):
+        return list(DailySales.objects.values_list('quantity', 'revenue'))
+
+    def test_live_and_archived_items_are_summed(self):
+        order = self.create_order(quantity=2)
+        archived = ArchivedOrder.objects.create(
+            id=order.id + 1000,
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва',
+            status='DONE',
+            payment_method=Order.PaymentMethod.CASH,
+            date_registration=order.date_registration,
+            assigned_restaurant=self.restaurant,
+        )
+        ArchivedOrderItem.objects.create(order=archived, product=self.product, quantity=3, price=100)
+
+        refresh_daily_sales()
+
+        self.assertEqual(self.totals(), [(5, 500)])
+
+    def test_deleted_order_is_taken_out_incrementally(self):
+        self.create_order(quantity=2)
+        deleted = self.create_order(quantity=3)
+        refresh_daily_sales()
+        self.assertEqual(self.totals(), [(5, 500)])
+
+        deleted.delete()
+        refresh_daily_sales()
+
+        self.assertEqual(self.totals(), [(2, 200)])
+        refresh_daily_sales(rebuild=True)
+        self.assertEqual(self.totals(), [(2, 200)])
+
+    def test_order_done_later_is_picked_up(self):
+        order = self.create_order(quantity=2, status='NEW')
+        refresh_daily_sales()
+        self.assertEqual(self.totals(), [])
+
+        order.status = 'DONE'
+        order.save()
+
+        self.assertEqual(refresh_daily_sales(), 1)
+        self.assertEqual(self.totals(), [(2, 200)])
+
+    @override_settings(SALES_ROLLUP_OVERLAP=0)
+    def test_unchanged_days_are_skipped(self):
+        self.create_order(quantity=2)
+        refresh_daily_sales()
+
+        self.assertEqual(refresh_daily_sales(), 0)
+        self.assertEqual(self.totals(), [(2, 200)])
+
+    def test_report_is_grouped(self):
+        fries = Product.objects.create(name='Картошка', price=50, image='fries.jpg')
+        self.create_order(quantity=2)
+        self.create_order(quantity=1, product=fries)
+        refresh_daily_sales()
+        today = timezone.localdate()
+
+        rows, totals = get_sales_report(today, today, 'product')
+        self.assertEqual(
+            [(row['product__name'], row['quantity'], row['revenue']) for row in rows],
+            [('Бургер', 2, 200), ('Картошка', 1, 100)],
+        )
+        self.assertEqual(totals, {'quantity': 3, 'revenue': 300})
+
+        rows, _ = get_sales_report(today, today, 'restaurant')
+        self.assertEqual([row['restaurant_id'] for row in rows], [self.restaurant.id])
+
+        yesterday = today - timedelta(days=1)
+        self.assertEqual(
+            get_sales_report(yesterday, yesterday, 'day'), ([], {'quantity': 0, 'revenue': 0}))
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def create_order(self, status='DONE', days_ago=100):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+            status=status,
+            delivered_at=timezone.now() - timedelta(days=days_ago),
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price=100)
+        return order
+
+    def test_old_done_orders_move_with_items(self):
+        old = self.create_order()
+        self.create_order(days_ago=10)
+        self.create_order(status='UNPROCESSED')
+
+        self.assertEqual(archive_batch(get_archivable_orders(90), batch_size=100), 1)
+
+        self.assertFalse(Order.objects.filter(id=old.id).exists())
+        self.assertEqual(Order.objects.count(), 2)
+        archived = ArchivedOrder.objects.get(id=old.id)
+        self.assertEqual(archived.total_price, 200)
+        self.assertEqual(
+            list(ArchivedOrderItem.objects.values_list('order_id', 'quantity')), [(old.id, 2)])
+        self.assertEqual(OrderItem.objects.filter(order_id=old.id).count(), 0)
+        self.assertFalse(DeletedOrder.objects.exists())
+
+    def test_archiving_keeps_daily_sales(self):
+        self.create_order()
+        refresh_daily_sales()
+        before = list(DailySales.objects.values_list('day', 'quantity', 'revenue'))
+        self.assertEqual([row[1:] for row in before], [(2, 200)])
+
+        archive_batch(get_archivable_orders(90), batch_size=100)
+        refresh_daily_sales(rebuild=True)
+
+        self.assertEqual(
+            list(DailySales.objects.values_list('day', 'quantity', 'revenue')), before)
+
+    def test_delete_rows_splits_values_into_batches(self):
+        Order.objects.bulk_create(
+            Order(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79001234567',
+                address='Москва',
+                comment='archive test',
+            )
+            for _ in range(1200)
+        )
+        order_ids = list(Order.objects.values_list('id', flat=True))
+        batch_size = connection.ops.bulk_batch_size(
+            [Order._meta.get_field('id')], order_ids)
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = delete_rows(Order, 'id', order_ids)
+
+        self.assertEqual(deleted, 1200)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(len(queries), -(-1200 // batch_size))
@@ -0,0 +1,120 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+
+def thumbnail_name(name, width, image_format):
+    """`products/burger.jpg` → `products/burger.320w.webp` рядом с оригиналом."""
+    extension, _ = THUMBNAIL_FORMATS[image_format]
+    root, _ = os.path.splitext(name)
+    return f'{root}.{width}w.{extension}'
+
+
+def has_thumbnails(product):
+    """Есть ли у текущей картинки товара копии во всех нужных ширинах."""
+    thumbnails = product.thumbnails or {}
+    return (
+        thumbnails.get('image') == product.image.name
+        and {str(width) for width in settings.THUMBNAIL_WIDTHS} <= thumbnails['widths'].keys()
+    )
+
+
+def generate_thumbnails(name, storage=default_storage):
+    """Сохраняет уменьшенные копии картинки во всех ширинах и форматах.
+
+    Узкие картинки не растягиваются. Возвращает то, что надо записать
+    в `Product.thumbnails`: имя картинки и настоящую ширину каждой копии.
+    """
+    with storage.open(name) as image_file:
+        image = Image.open(image_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    widths = {}
+    for width in settings.THUMBNAIL_WIDTHS:
+        target_width = min(width, image.width)
+        height = max(round(image.height * target_width / image.width), 1)
+        resized = image.resize((target_width, height), Image.LANCZOS)
+        for image_format, (_, save_options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, format=image_format.upper(), **save_options)
+            derivative_name = thumbnail_name(name, width, image_format)
+            if storage.exists(derivative_name):
+                storage.delete(derivative_name)
+            storage.save(derivative_name, ContentFile(buffer.getvalue()))
+        widths[str(width)] = target_width
+    return {'image': name, 'widths': widths}
+
+
+def generate_thumbnails_safely(name):
+    """То же, что `generate_thumbnails`, но битая картинка не роняет вызывающего."""
+    try:
+        return generate_thumbnails(name)
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning(f'Could not make thumbnails for {name}: {e}')
+        return None
+
+
+def get_thumbnail_widths(product):
+    """Пары (настоящая ширина, ширина в имени файла) от узкой к широкой.
+
+    Копии одной настоящей ширины, например из узкого оригинала,
+    схлопываются в самую узкую по имени.
+    """
+    if not product.image or not has_thumbnails(product):
+        return []
+    widths = {}
+    for width, real_width in sorted(
+            (int(width), real_width)
+            for width, real_width in product.thumbnails['widths'].items()):
+        widths.setdefault(real_width, width)
+    return sorted(widths.items())
+
+
+def get_srcset(product, image_format):
+    """Строка для атрибута `srcset`: `/media/a.160w.webp 160w, ...`.
+
+    Если уменьшенных копий ещё нет, отдаёт оригинал.
+    """
+    image = product.image
+    if not image:
+        return ''
+    widths = get_thumbnail_widths(product)
+    if not widths:
+        return image.url
+    return ', '.join(
+        f'{image.storage.url(thumbnail_name(image.name, width, image_format))} {real_width}w'
+        for real_width, width in widths
+    )
+
+
+def get_thumbnail_url(product, width, image_format='jpeg'):
+    """Самая маленькая копия не уже `width`, а если копий нет — оригинал."""
+    image = product.image
+    widths = get_thumbnail_widths(product)
+    if not widths:
+        return image.url
+    _, suitable_width = next(
+        ((real_width, known) for real_width, known in widths if real_width >= width),
+        widths[-1],
+    )
+    return image.storage.url(thumbnail_name(image.name, suitable_width, image_format))
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, register_order
+from .views import (banners_list_api, product_list_api, register_order,
+                    register_order_async)
 
 
 app_name = "foodcartapp"
@@ -8,5 +10,5 @@ app_name = "foodcartapp"
 urlpatterns = [
     path('products/', product_list_api),
     path('banners/', banners_list_api),
-    path('order/', register_order),
+    path('order/', register_order_async if settings.ORDER_API_ASYNC else register_order),
 ]
@@ -1,10 +1,18 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import (HttpResponse, HttpResponseNotAllowed, JsonResponse,
+                         StreamingHttpResponse)
 from django.templatetags.static import static
+from django.utils.cache import get_conditional_response
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from .models import Product
-from .serializers import OrderSerializer, ReadOrderSerializer
+from star_burger.db_routers import pin_database, read_from_replica
+
+from .catalogue import filter_products, get_catalogue, serialize_product, stream_catalogue
+from .serializers import OrderSerializer, ProductFilterSerializer, ReadOrderSerializer
 
 
 @api_view(['GET'])
@@ -29,30 +37,47 @@ def banners_list_api(request):
     ])
 
 
+PRODUCT_FILTER_PARAMS = {'category', 'restaurant', 'special_status', 'cursor', 'limit', 'stream'}
+
+
+@read_from_replica
 @api_view(['GET'])
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return Response(dumped_products)
+    if PRODUCT_FILTER_PARAMS & request.query_params.keys():
+        return filtered_product_list(request)
+
+    etag, body = get_catalogue()
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = f'"{etag}"'
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def filtered_product_list(request):
+    filters = ProductFilterSerializer(data=request.query_params.dict())
+    filters.is_valid(raise_exception=True)
+    params = filters.validated_data
+
+    products = filter_products(
+        category=params.get('category'),
+        restaurant=params.get('restaurant'),
+        special_status=params.get('special_status'),
+        after_id=params.get('cursor'),
+    )
+    if params['stream']:
+        return StreamingHttpResponse(
+            stream_catalogue(pin_database(products)), content_type='application/json')
+
+    page = list(products[:params['limit'] + 1])
+    next_url = None
+    if len(page) > params['limit']:
+        page = page[:params['limit']]
+        query = request.query_params.copy()
+        query['cursor'] = ProductFilterSerializer.encode_cursor(page[-1].id)
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return Response({
+        'results': [serialize_product(product) for product in page],
+        'next': next_url,
+    })
 
 
 @api_view(['POST'])
@@ -62,3 +87,38 @@ def register_order(request):
     order = serializer.save()
     read_serializer = ReadOrderSerializer(order)
     return Response(read_serializer.data, status=status.HTTP_200_OK)
+
+
+def create_order(data):
+    """Проверяет и сохраняет заказ. Возвращает пару (данные заказа, ошибки)."""
+    serializer = OrderSerializer(data=data)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    order = serializer.save()
+    return ReadOrderSerializer(order).data, None
+
+
+async def register_order_async(request):
+    """Асинхронный вариант `register_order` для запуска под ASGI.
+
+    Пока заказ пишется в базу, процесс принимает другие запросы. ORM
+    в Django 3.2 синхронная, поэтому проверка и запись идут одним вызовом
+    через `sync_to_async`. Декораторы `csrf_exempt` и `require_POST`
+    в Django 3.2 делают из корутины обычную функцию, поэтому метод
+    проверяется вручную, а от CSRF view освобождается атрибутом, как
+    и DRF-вариант.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        data = json.loads(request.body)
+    except ValueError as e:
+        return JsonResponse({'detail': f'JSON parse error - {e}'}, status=400)
+
+    order, errors = await sync_to_async(create_order)(data)
+    if errors:
+        return JsonResponse(errors, status=400)
+    return JsonResponse(order, status=200)
+
+
+register_order_async.csrf_exempt = True
@@ -1,3 +1,397 @@
-from django.test import TestCase
+import csv
+import json
+import re
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from foodcartapp.availability import set_menu_availability
+from foodcartapp.menu_index import menu_index
+from foodcartapp.models import (ArchivedOrder, ArchivedOrderItem, Order,
+                                OrderItem, Product, Restaurant,
+                                RestaurantMenuItem,
+                                refresh_open_orders_candidates)
+from foodcartapp.spatial import restaurant_index
+from star_burger.db_routers import (PRIMARY_PIN_COOKIE, PrimaryPinMiddleware,
+                                    ReplicaHealth, read_from_replica,
+                                    replica_health)
+from star_burger.metrics import registry
+
+
+@override_settings(REPLICA_DATABASE=None)
+class OrderChangesTest(TestCase):
+    def setUp(self):
+        for index in [menu_index, restaurant_index]:
+            index.invalidate()
+            self.addCleanup(index.invalidate)
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        self.client.force_login(manager)
+
+        self.restaurant = Restaurant.objects.create(
+            name='Бургерная', address='Москва', latitude='55.75', longitude='37.61')
+        self.burger, self.fries = [
+            Product.objects.create(name=name, price=100, image='burger.jpg')
+            for name in ['Бургер', 'Картошка']
+        ]
+        RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.burger)
+        self.burger_order = self.create_order(self.burger)
+        self.fries_order = self.create_order(self.fries)
+        refresh_open_orders_candidates()
+
+    def create_order(self, product):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+            latitude='55.76',
+            longitude='37.62',
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+        return order
+
+    def get_changes(self, since):
+        response = self.client.get('/manager/orders/changes/', {'since': since.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_refresh_without_changes_writes_nothing(self):
+        self.assertEqual(refresh_open_orders_candidates(), 0)
+
+    def test_menu_change_touches_only_affected_orders(self):
+        Order.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        since = timezone.now()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.fries)
+
+        self.fries_order.refresh_from_db()
+        self.assertEqual(
+            [restaurant['restaurant_id'] for restaurant in self.fries_order.candidate_restaurants],
+            [self.restaurant.id],
+        )
+        changes = self.get_changes(since)
+        self.assertEqual([row['id'] for row in changes['changed']], [self.fries_order.id])
+
+
+
+@override_settings(REPLICA_DATABASE=None, THUMBNAIL_WIDTHS=[160, 320])
+class ProductRowsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        self.client.force_login(manager)
+        self.product = Product.objects.create(
+            name='Бургер', price=100, image='products/burger.jpg',
+            thumbnails={'image': 'products/burger.jpg', 'widths': {'160': 160, '320': 320}},
+        )
+
+    def get_rows(self):
+        response = self.client.get('/manager/products/')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_row_shows_thumbnail_and_srcset(self):
+        rows = self.get_rows()
+
+        self.assertIn('src="/media/products/burger.160w.jpg"', rows)
+        self.assertIn(
+            'srcset="/media/products/burger.160w.webp 160w, /media/products/burger.320w.webp 320w"',
+            rows,
+        )
+        self.assertNotIn('"/media/products/burger.jpg"', rows)
+
+    def test_row_without_thumbnails_shows_original(self):
+        self.product.thumbnails = None
+        self.product.save()
+
+        rows = self.get_rows()
+
+        self.assertIn('src="/media/products/burger.jpg"', rows)
+        self.assertNotIn('srcset', rows)
+
+
+
+
+@override_settings(REPLICA_DATABASE=None)
+class ProductsMatrixTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        menu_index.invalidate()
+        self.addCleanup(menu_index.invalidate)
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        self.client.force_login(manager)
+        self.restaurants = [
+            Restaurant.objects.create(name=name, address='Москва')
+            for name in ['Бургерная', 'Закусочная']
+        ]
+        self.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(3)
+        ]
+        RestaurantMenuItem.objects.create(restaurant=self.restaurants[0], product=self.products[0])
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurants[1], product=self.products[1], availability=False)
+
+    def get_availability(self):
+        response = self.client.get('/manager/products/')
+        self.assertEqual(response.status_code, 200)
+        return {
+            (int(restaurant_id), int(product_id)): bool(checked)
+            for restaurant_id, product_id, checked in re.findall(
+                r'data-restaurant="(\d+)" data-product="(\d+)"\s*(checked)?',
+                response.content.decode(),
+            )
+        }
+
+    def test_checkboxes_follow_menu(self):
+        availability = self.get_availability()
+
+        self.assertEqual(len(availability), 6)
+        self.assertEqual(
+            [key for key, checked in availability.items() if checked],
+            [(self.restaurants[0].id, self.products[0].id)],
+        )
+
+    def test_cached_rows_are_not_rendered_again(self):
+        self.get_availability()
+        with mock.patch('restaurateur.views.render_to_string') as render_row:
+            self.get_availability()
+        render_row.assert_not_called()
+
+    def test_menu_change_renders_only_changed_row(self):
+        self.get_availability()
+        with self.captureOnCommitCallbacks(execute=True):
+            set_menu_availability([{
+                'restaurant': self.restaurants[1].id,
+                'product': self.products[1].id,
+                'availability': True,
+            }])
+
+        with mock.patch(
+                'restaurateur.views.render_to_string',
+                wraps=render_to_string) as render_row:
+            availability = self.get_availability()
+
+        self.assertEqual(render_row.call_count, 1)
+        self.assertTrue(availability[(self.restaurants[1].id, self.products[1].id)])
+
+    def test_query_count_does_not_grow_with_products(self):
+        self.get_availability()
+        cache.clear()
+        with CaptureQueriesContext(connection) as few_products:
+            self.get_availability()
+
+        Product.objects.bulk_create(
+            Product(name=f'Картошка {number}', price=50, image='fries.jpg')
+            for number in range(10)
+        )
+        cache.clear()
+        with self.assertNumQueries(len(few_products)):
+            self.get_availability()
+
+
+@override_settings(REPLICA_DATABASE=None)
+class ExportOrdersTest(TestCase):
+    def setUp(self):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        self.client.force_login(manager)
+        self.restaurant = Restaurant.objects.create(name='Бургерная', address='Москва')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+        archived = ArchivedOrder.objects.create(
+            id=1000,
+            firstname='Анна',
+            lastname='Старая',
+            phonenumber='+79001234567',
+            address='Москва',
+            status='DONE',
+            payment_method=Order.PaymentMethod.CASH,
+            date_registration=timezone.now() - timedelta(days=200),
+            assigned_restaurant=self.restaurant,
+            total_price=300,
+        )
+        ArchivedOrderItem.objects.create(order=archived, product=self.product, quantity=3, price=100)
+        self.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79001234567',
+            address='Москва, Тверская улица, 1',
+        )
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=100)
+
+    def export(self, **params):
+        response = self.client.get('/manager/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_lists_archive_first(self):
+        rows = list(csv.DictReader(self.export().splitlines()))
+
+        self.assertEqual(
+            [(row['order_id'], row['quantity'], row['order_total']) for row in rows],
+            [('1000', '3', '300.00'), (str(self.order.id), '2', '200.00')],
+        )
+
+    def test_ndjson_is_filtered_by_status(self):
+        lines = self.export(format='ndjson', status='DONE').splitlines()
+
+        self.assertEqual([json.loads(line)['lastname'] for line in lines], ['Старая'])
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get('/manager/orders/export/', {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rows_are_read_while_streaming(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/manager/orders/export/')
+            read_before = len(queries)
+            b''.join(response.streaming_content)
+
+        self.assertFalse(
+            [query for query in queries[:read_before] if 'orderitem' in query['sql']])
+        self.assertTrue(
+            [query for query in queries[read_before:] if 'orderitem' in query['sql']])
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(replica_health, 'is_healthy', return_value=True)
+        self.is_healthy = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+        self.databases_seen = []
+
+    def view(self, request):
+        self.databases_seen.append(Product.objects.all().db)
+        if 'write' in request.GET:
+            Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+            self.databases_seen.append(Product.objects.all().db)
+        return HttpResponse()
+
+    def test_safe_request_reads_from_replica(self):
+        read_from_replica(self.view)(self.factory.get('/'))
+
+        self.assertEqual(self.databases_seen, ['replica'])
+        self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_read_after_write_goes_to_primary(self):
+        read_from_replica(self.view)(self.factory.get('/', {'write': 1}))
+
+        self.assertEqual(self.databases_seen, ['replica', 'default'])
+
+    def test_unsafe_request_reads_from_primary(self):
+        read_from_replica(self.view)(self.factory.post('/'))
+
+        self.assertEqual(self.databases_seen, ['default'])
+
+    def test_pin_cookie_reads_from_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        read_from_replica(self.view)(request)
+
+        self.assertEqual(self.databases_seen, ['default'])
+
+    def test_unsafe_request_sets_pin_cookie(self):
+        middleware = PrimaryPinMiddleware(lambda request: HttpResponse())
+
+        self.assertNotIn(PRIMARY_PIN_COOKIE, middleware(self.factory.get('/')).cookies)
+        response = middleware(self.factory.post('/'))
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        self.is_healthy.return_value = False
+        read_from_replica(self.view)(self.factory.get('/'))
+
+        self.assertEqual(self.databases_seen, ['default'])
+
+
+class ReplicaHealthTest(TestCase):
+    def check_lag(self, lag):
+        connection = mock.MagicMock(vendor='postgresql')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = [lag]
+        with mock.patch('star_burger.db_routers.connections', {'replica': connection}):
+            return ReplicaHealth.check('replica')
+
+    @override_settings(REPLICA_MAX_LAG=5)
+    def test_lagging_replica_is_unhealthy(self):
+        self.assertTrue(self.check_lag(1))
+        self.assertFalse(self.check_lag(30))
+
+    @override_settings(REPLICA_CHECK_INTERVAL=60)
+    def test_result_is_cached_for_check_interval(self):
+        health = ReplicaHealth()
+        with mock.patch.object(ReplicaHealth, 'check', return_value=False) as check:
+            self.assertFalse(health.is_healthy())
+            self.assertFalse(health.is_healthy())
+        self.assertEqual(check.call_count, 1)
+
+
+@skipUnless(settings.REPLICA_DATABASE, 'REPLICA_DB_URL не задан')
+class ReplicaAliasTest(TransactionTestCase):
+    """Запускается с настроенной репликой, например
+    `REPLICA_DB_URL=sqlite:////tmp/replica.sqlite3 python manage.py test`.
+    Реплика в тестах зеркалит основную базу через отдельное соединение,
+    поэтому данные должны быть закоммичены."""
+
+    databases = {'default', settings.REPLICA_DATABASE or 'default'}
+
+    def setUp(self):
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+
+    def test_replica_alias_serves_reads(self):
+        self.assertTrue(ReplicaHealth.check(settings.REPLICA_DATABASE))
+        Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+        view = read_from_replica(lambda request: HttpResponse(
+            ','.join(Product.objects.values_list('name', flat=True))))
+        response = view(RequestFactory().get('/'))
+
+        self.assertEqual(response.content.decode(), 'Бургер')
+
+
+@override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=['10.0.0.5'])
+class MetricsAccessTest(TestCase):
+    def get_metrics(self, **headers):
+        return self.client.get('/metrics', **headers)
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.get_metrics().status_code, 403)
+
+    def test_staff_sees_metrics(self):
+        registry.inc('starburger_http_requests_total', {'view': 'test', 'method': 'GET'})
+        self.client.force_login(User.objects.create_user('manager', is_staff=True))
+
+        response = self.get_metrics()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('starburger_http_requests_total{', response.content.decode())
+
+    def test_regular_user_is_forbidden(self):
+        self.client.force_login(User.objects.create_user('customer'))
+        self.assertEqual(self.get_metrics().status_code, 403)
+
+    def test_token_opens_metrics(self):
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='secret').status_code, 403)
+
+    def test_allowed_address_opens_metrics(self):
+        self.assertEqual(self.get_metrics(REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.get_metrics(REMOTE_ADDR='10.0.0.6').status_code, 403)
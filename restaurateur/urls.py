@@ -9,11 +9,18 @@ urlpatterns = [
     path('', lambda request: redirect('restaurateur:ProductsView')),
 
     path('products/', views.view_products, name="ProductsView"),
+    path('products/availability/', views.update_availability, name="update_availability"),
 
     path('restaurants/', views.view_restaurants, name="RestaurantView"),
 
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
+    path('orders/changes/', views.view_order_changes, name="order_changes"),
+    path('orders/dispatch/', views.dispatch_orders, name="dispatch_orders"),
+    path('orders/export/', views.export_orders, name="export_orders"),
+
+    path('sales/', views.view_sales, name="view_sales"),
+    path('sales/api/', views.sales_api, name="sales_api"),
 
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
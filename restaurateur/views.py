@@ -1,16 +1,41 @@
 
+import hashlib
+import json
 import logging
+from datetime import timedelta
 
 from django import forms
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
-from django.db.models import Prefetch
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.template.loader import render_to_string
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.safestring import mark_safe
 from django.views import View
+from django.views.decorators.http import require_POST
 
-from foodcartapp.models import Order, OrderItem, Product, Restaurant
+from foodcartapp.availability import set_menu_availability
+from foodcartapp.dispatch import dispatch_new_orders
+from foodcartapp.exports import (EXPORT_FORMATS, get_export_items,
+                                 iter_export_rows, render_export)
+from foodcartapp.menu_index import menu_index
+from foodcartapp.models import (DeletedOrder, Order, OrderItem, Product,
+                                ProductCategory, Restaurant,
+                                fill_candidate_restaurants)
+from foodcartapp.rollups import REPORT_GROUPS, get_sales_report
+from foodcartapp.serializers import MenuAvailabilitySerializer
+from foodcartapp.thumbnails import (THUMBNAIL_FORMATS, get_srcset, get_thumbnail_url,
+                                    has_thumbnails)
+from star_burger.db_routers import pin_database, read_from_replica
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +57,63 @@ class Login(forms.Form):
     )
 
 
+class SalesReportForm(forms.Form):
+    date_from = forms.DateField(
+        label='С', required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+    )
+    date_to = forms.DateField(
+        label='По', required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+    )
+    group_by = forms.ChoiceField(
+        label='Группировать', required=False,
+        choices=[
+            ('restaurant', 'по ресторанам'),
+            ('product', 'по товарам'),
+            ('day', 'по дням'),
+        ],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        today = timezone.localdate()
+        cleaned_data['date_to'] = cleaned_data.get('date_to') or today
+        cleaned_data['date_from'] = (
+            cleaned_data.get('date_from') or cleaned_data['date_to'] - timedelta(days=30))
+        cleaned_data['group_by'] = cleaned_data.get('group_by') or 'restaurant'
+        if cleaned_data['date_from'] > cleaned_data['date_to']:
+            raise forms.ValidationError('Начало периода позже конца')
+        return cleaned_data
+
+
+class ProductFilterForm(forms.Form):
+    category = forms.ModelChoiceField(
+        label='Категория', required=False,
+        queryset=ProductCategory.objects.order_by('name'),
+        empty_label='Все категории',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+
+class OrderExportForm(forms.Form):
+    date_from = forms.DateField(label='С', required=False)
+    date_to = forms.DateField(label='По', required=False)
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'любой')] + Order.STATUS_CHOICES,
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False,
+        queryset=Restaurant.objects.all(),
+    )
+    format = forms.ChoiceField(
+        label='Формат', required=False,
+        choices=[(export_format, export_format) for export_format in EXPORT_FORMATS],
+    )
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -67,31 +149,94 @@ def is_manager(user):
     return user.is_staff
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+def render_product_rows(products, restaurants):
+    """HTML строк таблицы наличия, по возможности из кэша.
+
+    Наличие берётся из битовых масок индекса меню. Ключ кэша строки
+    зависит от товара, его маски и набора колонок, поэтому после правки
+    меню или товара строка просто получит новый ключ.
+    """
+    restaurant_ids = [restaurant.id for restaurant in restaurants]
+    columns, masks = menu_index.product_masks(
+        [product.id for product in products], restaurant_ids)
+    columns_key = hashlib.md5(repr(list(zip(restaurant_ids, columns))).encode()).hexdigest()
 
-    products_with_restaurant_availability = []
+    keys = {}
     for product in products:
-        availability = {
-            item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(
-            restaurant.id, False) for restaurant in restaurants]
+        fingerprint = repr((
+            columns_key, masks[product.id], product.name,
+            str(product.category), str(product.price), product.image.name,
+            product.thumbnails,
+        ))
+        digest = hashlib.md5(fingerprint.encode()).hexdigest()
+        keys[product.id] = f'restaurateur:product_row:{product.id}:{digest}'
+
+    cached_rows = cache.get_many(keys.values())
+    rendered_rows = {}
+    rows = []
+    for product in products:
+        key = keys[product.id]
+        row = cached_rows.get(key)
+        if row is None:
+            mask = masks[product.id]
+            row = render_to_string('product_row.html', {
+                'product': product,
+                'image_url': get_thumbnail_url(product, 100),
+                'image_srcset': {
+                    image_format: get_srcset(product, image_format)
+                    for image_format in THUMBNAIL_FORMATS
+                } if has_thumbnails(product) else {},
+                'availability': [
+                    (restaurant_id, bool(mask >> column & 1))
+                    for restaurant_id, column in zip(restaurant_ids, columns)
+                ],
+            })
+            rendered_rows[key] = row
+        rows.append(mark_safe(row))
+    cache.set_many(rendered_rows, settings.PRODUCT_ROW_CACHE_TIMEOUT)
+    return rows
 
-        products_with_restaurant_availability.append(
-            (product, ordered_availability)
-        )
 
+@read_from_replica
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_products(request):
+    form = ProductFilterForm(request.GET)
+    category = form.cleaned_data['category'] if form.is_valid() else None
+
+    products = Product.objects.select_related('category').order_by('id')
+    if category:
+        products = products.filter(category=category)
+    page = Paginator(products, settings.PRODUCTS_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    restaurants = list(Restaurant.objects.order_by('name').only('id', 'name'))
+    query = request.GET.copy()
+    query.pop('page', None)
     return render(
         request, template_name="products_list.html",
         context={
-            'products_with_restaurant_availability': products_with_restaurant_availability,
+            'form': form,
+            'page': page,
+            'rows': render_product_rows(list(page), restaurants),
             'restaurants': restaurants,
+            'query': query.urlencode(),
         }
     )
 
 
+@require_POST
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def update_availability(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Тело запроса должно быть JSON'}, status=400)
+    serializer = MenuAvailabilitySerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    changed = set_menu_availability(serializer.validated_data['changes'])
+    return JsonResponse({'changed': changed})
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
@@ -99,15 +244,172 @@ def view_restaurants(request):
     })
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
-    restaurants = Restaurant.objects.all()
-    orders = Order.objects.get_not_done_orders_with_total_price().prefetch_related(
-        Prefetch(
+def get_open_orders():
+    return (
+        Order.objects.get_not_done_orders_with_total_price()
+        .select_related('assigned_restaurant')
+    )
+
+
+def with_candidate_restaurants(orders):
+    """Список заказов, у каждого из которых есть `candidate_restaurants`.
+
+    Рестораны сохраняет воркер геокодирования. Заказам, до которых он ещё
+    не дошёл, они считаются на лету и в базу не пишутся: доска заказов
+    читает с реплики.
+    """
+    orders = list(orders)
+    missing = [order for order in orders if order.candidate_restaurants is None]
+    if missing:
+        prefetch_related_objects(missing, Prefetch(
             'order_items',
-            queryset=OrderItem.objects.select_related('product'))
-    ).get_orders_with_restaurants(restaurants)
+            queryset=OrderItem.objects.only('id', 'order_id', 'product_id'),
+        ))
+        fill_candidate_restaurants(missing)
+    return orders
 
+
+def encode_orders_cursor(moment):
+    return moment.isoformat()
+
+
+def decode_orders_cursor(cursor):
+    moment = parse_datetime(cursor or '')
+    if moment is None:
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return moment
+
+
+@read_from_replica
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders(request):
     return render(request, template_name='order_items.html', context={
-        'orders': orders,
+        'orders': with_candidate_restaurants(
+            get_open_orders().order_by('date_registration', 'id')),
+        'cursor': encode_orders_cursor(timezone.now()),
+        'poll_interval': settings.ORDERS_BOARD_POLL_INTERVAL,
+        'orders_board_url': request.path,
     })
+
+
+@require_POST
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def dispatch_orders(request):
+    assignment, distance = dispatch_new_orders()
+    if assignment:
+        messages.success(
+            request,
+            f'Распределено заказов: {len(assignment)}, '
+            f'суммарное расстояние {distance:.1f} км',
+        )
+    else:
+        messages.info(request, 'Нет заказов, которые можно распределить')
+    return redirect('restaurateur:view_orders')
+
+
+@read_from_replica
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_changes(request):
+    try:
+        since = decode_orders_cursor(request.GET.get('since'))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    cursor = encode_orders_cursor(timezone.now())
+    changed_since = since - timedelta(seconds=settings.ORDERS_BOARD_CURSOR_OVERLAP)
+    changed_orders = Order.objects.filter(updated_at__gte=changed_since)
+
+    removed_ids = list(
+        changed_orders.filter(status='DONE').values_list('id', flat=True))
+    removed_ids += DeletedOrder.objects.filter(
+        deleted_at__gte=changed_since,
+    ).values_list('order_id', flat=True)
+    changed = [
+        {
+            'id': order.id,
+            'html': render_to_string('order_row.html', {
+                'order': order,
+                'orders_board_url': reverse('restaurateur:view_orders'),
+            }, request=request),
+        }
+        for order in with_candidate_restaurants(
+            get_open_orders()
+            .filter(updated_at__gte=changed_since)
+            .order_by('date_registration', 'id')
+        )
+    ]
+    return JsonResponse({
+        'cursor': cursor,
+        'changed': changed,
+        'removed': removed_ids,
+    })
+
+
+@read_from_replica
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_sales(request):
+    form = SalesReportForm(request.GET)
+    rows, totals = [], None
+    if form.is_valid():
+        rows, totals = get_sales_report(
+            form.cleaned_data['date_from'],
+            form.cleaned_data['date_to'],
+            form.cleaned_data['group_by'],
+        )
+    return render(request, template_name='sales_report.html', context={
+        'form': form,
+        'rows': rows,
+        'totals': totals,
+        'group_by': form.cleaned_data.get('group_by') if form.is_valid() else None,
+    })
+
+
+@read_from_replica
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def sales_api(request):
+    form = SalesReportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    date_from = form.cleaned_data['date_from']
+    date_to = form.cleaned_data['date_to']
+    group_by = form.cleaned_data['group_by']
+    rows, totals = get_sales_report(date_from, date_to, group_by)
+    key_field, *name_fields = REPORT_GROUPS[group_by]
+    return JsonResponse({
+        'date_from': date_from,
+        'date_to': date_to,
+        'group_by': group_by,
+        'totals': totals,
+        'rows': [
+            {
+                'key': row[key_field],
+                'name': row[name_fields[0]] if name_fields else None,
+                'quantity': row['quantity'],
+                'revenue': row['revenue'],
+            }
+            for row in rows
+        ],
+    })
+
+
+@read_from_replica
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def export_orders(request):
+    form = OrderExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    export_format = form.cleaned_data['format'] or 'csv'
+    querysets = get_export_items(
+        date_from=form.cleaned_data['date_from'],
+        date_to=form.cleaned_data['date_to'],
+        status=form.cleaned_data['status'],
+        restaurant=form.cleaned_data['restaurant'],
+    )
+    querysets = [pin_database(queryset) for queryset in querysets]
+    response = StreamingHttpResponse(
+        render_export(iter_export_rows(querysets), export_format),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    filename = f'orders_{timezone.localdate():%Y-%m-%d}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
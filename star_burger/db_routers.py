@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+PRIMARY_PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+POSTGRES_LAG_SQL = '''
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+class ReplicaHealth:
+    """Помнит, можно ли сейчас читать с реплики.
+
+    Проверка — запрос к реплике на отставание от мастера. Результат
+    живёт `REPLICA_CHECK_INTERVAL` секунд, чтобы не проверять на каждом
+    запросе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._healthy = False
+
+    def is_healthy(self):
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < settings.REPLICA_CHECK_INTERVAL:
+            return self._healthy
+        with self._lock:
+            self._healthy = self.check(settings.REPLICA_DATABASE)
+            self._checked_at = time.monotonic()
+        return self._healthy
+
+    @staticmethod
+    def check(alias):
+        try:
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                if connection.vendor != 'postgresql':
+                    cursor.execute('SELECT 1')
+                    return True
+                cursor.execute(POSTGRES_LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError as e:
+            logger.warning(f'Replica {alias} is unavailable: {e}')
+            return False
+        if lag is not None and lag > settings.REPLICA_MAX_LAG:
+            logger.warning(f'Replica {alias} lags behind by {lag:.1f}s')
+            return False
+        return True
+
+    def reset(self):
+        self._checked_at = None
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """Отправляет чтение в реплику внутри view с `@read_from_replica`.
+
+    Всё остальное идёт в `default`. Если реплики нет в настройках или она
+    отстаёт, читаем тоже из `default`. Чтение после записи в том же
+    запросе переключает на `default` сам `read_from_replica`.
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and settings.REPLICA_DATABASE and replica_health.is_healthy():
+            return settings.REPLICA_DATABASE
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != settings.REPLICA_DATABASE
+
+
+def pin_primary_on_write(execute, sql, params, many, context):
+    """Обёртка запросов к `default`: после первой записи читаем только из него."""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        replica_reads.set(False)
+    return execute(sql, params, many, context)
+
+
+def read_from_replica(view):
+    """Разрешает view читать из реплики.
+
+    Только для безопасных методов и только если пользователь недавно
+    ничего не менял: после POST сайт ставит куку `primary_pin`, и пока
+    она жива, пользователь видит свои правки из мастера. Если view сам
+    что-то пишет в `default`, дальнейшее чтение тоже идёт туда.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or PRIMARY_PIN_COOKIE in request.COOKIES:
+            return view(request, *args, **kwargs)
+        token = replica_reads.set(True)
+        try:
+            with connections['default'].execute_wrapper(pin_primary_on_write):
+                return view(request, *args, **kwargs)
+        finally:
+            replica_reads.reset(token)
+    return wrapper
+
+
+def pin_database(queryset):
+    """Закрепляет за queryset базу, которую роутер выбрал бы сейчас.
+
+    Нужно для ответов, которые читают строки уже после выхода из view,
+    например потоковых: там `read_from_replica` уже не действует.
+    """
+    return queryset.using(queryset.db)
+
+
+class PrimaryPinMiddleware:
+    """После изменяющего запроса ставит куку, которая на время
+    `REPLICA_PIN_SECONDS` отключает чтение из реплики."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    @staticmethod
+    def pin(request, response):
+        if request.method in SAFE_METHODS or not settings.REPLICA_DATABASE:
+            return
+        response.set_cookie(
+            PRIMARY_PIN_COOKIE, '1',
+            max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite='Lax',
+        )
@@ -0,0 +1,172 @@
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+request_logger = logging.getLogger('star_burger.requests')
+
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+REQUEST_ID_PATTERN = re.compile(r'^[\w\-]{1,64}$')
+
+
+class RequestIdFilter(logging.Filter):
+    """Подписывает запись id текущего запроса."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON.
+
+    Поля, переданные через `extra`, попадают в запись как есть.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueFileHandler(QueueHandler):
+    """Кладёт записи в очередь, а в файл их пишет отдельный поток.
+
+    Поток запроса только ставит запись в очередь, запись на диск делает
+    `QueueListener` с `WatchedFileHandler`. Все процессы сайта дописывают
+    один файл, а ротирует его logrotate: `WatchedFileHandler` сам заново
+    откроет файл, когда тот переедет. Поток-писатель заводится при первой
+    записи в каждом процессе, потому что поток, запущенный до fork
+    (например, с `gunicorn --preload`), в воркере не работает.
+    """
+
+    def __init__(self, filename):
+        super().__init__(queue.SimpleQueue())
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file_handler = WatchedFileHandler(filename, encoding='utf-8', delay=True)
+        self.listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.close)
+
+    def _after_fork(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self.listener = QueueListener(self.queue, self.file_handler)
+            self.listener.start()
+            self._listener_pid = os.getpid()
+
+    def setFormatter(self, formatter):
+        self.file_handler.setFormatter(formatter)
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        if self.listener is not None and self._listener_pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._listener_pid = None
+        self.file_handler.close()
+        super().close()
+
+
+class RequestIdMiddleware:
+    """Выдаёт запросу id и пишет в лог строку о каждом запросе.
+
+    id берётся из заголовка `X-Request-ID`, если его поставил nginx,
+    иначе генерируется. Он же возвращается в ответе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request_id = self.get_request_id(request)
+        token = request_id_var.set(request_id)
+        started_at = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self.finish(request, response, request_id, started_at)
+            return response
+        finally:
+            request_id_var.reset(token)
+
+    async def __acall__(self, request):
+        request_id = self.get_request_id(request)
+        token = request_id_var.set(request_id)
+        started_at = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.finish(request, response, request_id, started_at)
+            return response
+        finally:
+            request_id_var.reset(token)
+
+    @staticmethod
+    def get_request_id(request):
+        request_id = request.headers.get('X-Request-ID', '')
+        if REQUEST_ID_PATTERN.match(request_id):
+            return request_id
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def finish(request, response, request_id, started_at):
+        match = request.resolver_match
+        request_logger.info('request finished', extra={
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started_at) * 1000, 2),
+        })
+        response['X-Request-ID'] = request_id
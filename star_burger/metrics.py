@@ -0,0 +1,315 @@
+import asyncio
+import atexit
+import bisect
+import contextvars
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HELP = {
+    'starburger_http_requests_total': ('counter', 'Обработанные запросы'),
+    'starburger_http_request_duration_seconds': ('histogram', 'Время ответа view'),
+    'starburger_db_queries_per_request': ('histogram', 'Число SQL-запросов за запрос'),
+    'starburger_db_query_duration_seconds': ('histogram', 'Время в базе за запрос'),
+    'starburger_geocoder_requests_total': ('counter', 'Запросы к геокодеру'),
+    'starburger_geocoder_request_duration_seconds': ('histogram', 'Время ответа геокодера'),
+    'starburger_geocode_cache_hits_total': ('counter', 'Попадания в кэш координат в памяти'),
+    'starburger_geocode_cache_misses_total': ('counter', 'Промахи кэша координат в памяти'),
+    'starburger_geocode_cache_evictions_total': ('counter', 'Вытеснения из кэша координат'),
+    'starburger_geocode_cache_expirations_total': ('counter', 'Устаревшие записи кэша координат'),
+    'starburger_geocode_cache_shared_hits_total': ('counter', 'Попадания в общий кэш координат'),
+    'starburger_geocode_cache_shared_misses_total': ('counter', 'Промахи общего кэша координат'),
+}
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы в памяти процесса.
+
+    У каждого воркера свой реестр. Если задан `METRICS_DIR`, воркер раз
+    в `METRICS_DUMP_INTERVAL` секунд сбрасывает туда свой снимок
+    в файл `metrics-<pid>.json`, а `/metrics` складывает снимки всех
+    воркеров. Без `METRICS_DIR` эндпоинт отдаёт только свой процесс.
+    Снимки пишет фоновый поток, чтобы не трогать диск в потоке запроса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._dumper_pid = None
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * (len(buckets) + 1),
+                    'sum': 0,
+                }
+            histogram['counts'][bisect.bisect_left(buckets, value)] += 1
+            histogram['sum'] += value
+
+    def snapshot(self):
+        from foodcartapp.geocache import geocode_cache
+
+        with self._lock:
+            counters = [
+                [name, dict(labels), value]
+                for (name, labels), value in self._counters.items()
+            ]
+            histograms = [
+                [name, dict(labels), dict(histogram, counts=list(histogram['counts']))]
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        counters.extend(
+            [f'starburger_geocode_cache_{counter}_total', {}, value]
+            for counter, value in geocode_cache.stats().items()
+            if counter not in ('size', 'maxsize')
+        )
+        return {'counters': counters, 'histograms': histograms}
+
+    def dump(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as dump_file:
+            json.dump(self.snapshot(), dump_file)
+        os.replace(temporary_path, path)
+
+    def start_dumper(self):
+        """Запускает поток, который сохраняет снимки в `METRICS_DIR`.
+
+        Поток заводится лениво в каждом процессе: после fork воркера
+        gunicorn поток родителя в нём уже не работает.
+        """
+        if not settings.METRICS_DIR or self._dumper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._dumper_pid == os.getpid():
+                return
+            self._dumper_pid = os.getpid()
+        threading.Thread(target=self._dump_forever, daemon=True).start()
+        atexit.register(self.dump)
+
+    def _dump_forever(self):
+        while True:
+            time.sleep(settings.METRICS_DUMP_INTERVAL)
+            try:
+                self.dump()
+            except OSError:
+                continue
+
+    def collect(self):
+        """Снимки всех воркеров: из `METRICS_DIR` или только свой."""
+        if not settings.METRICS_DIR:
+            return [self.snapshot()]
+        self.dump()
+        snapshots = []
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            try:
+                with open(path) as dump_file:
+                    snapshots.append(json.load(dump_file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+registry = MetricsRegistry()
+
+
+def merge_snapshots(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(sorted(labels.items())))] += value
+        for name, labels, histogram in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.get(key)
+            if merged is None or merged['buckets'] != histogram['buckets']:
+                histograms[key] = dict(histogram, counts=list(histogram['counts']))
+                continue
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+            merged['sum'] += histogram['sum']
+    return counters, histograms
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels
+    )
+    return f'{{{pairs}}}'
+
+
+def render_prometheus(snapshots):
+    counters, histograms = merge_snapshots(snapshots)
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name in described or name not in HELP:
+            return
+        described.add(name)
+        metric_type, description = HELP[name]
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f'{name}{format_labels(labels)} {value:g}')
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            cumulative += count
+            bucket_labels = labels + (('le', f'{bound:g}'),)
+            lines.append(f'{name}_bucket{format_labels(bucket_labels)} {cumulative}')
+        cumulative += histogram['counts'][-1]
+        lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {histogram["sum"]:g}')
+        lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """Считает SQL-запросы и их время внутри одного HTTP-запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+
+query_timer_var = contextvars.ContextVar('query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timer = query_timer_var.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.count += 1
+        timer.duration += time.perf_counter() - started_at
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """Вешает `time_query` на каждое подключение к базе.
+
+    Таймер текущего запроса берётся из contextvar, поэтому запросы
+    считаются и в синхронных view, и в асинхронных, где ORM работает
+    в отдельном потоке через `sync_to_async`.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class MetricsMiddleware:
+    """Меряет время ответа, число и время SQL-запросов для каждого view.
+
+    Работает и под WSGI, и под ASGI, не заставляя асинхронные view
+    выполняться в потоке.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = query_timer_var.set(timer)
+        started_at = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            query_timer_var.reset(token)
+        self.observe(request, response, timer, time.perf_counter() - started_at)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = query_timer_var.set(timer)
+        started_at = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_timer_var.reset(token)
+        self.observe(request, response, timer, time.perf_counter() - started_at)
+        return response
+
+    @staticmethod
+    def observe(request, response, timer, duration):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        labels = {'view': view, 'method': request.method}
+        registry.inc('starburger_http_requests_total', dict(labels, status=response.status_code))
+        registry.observe('starburger_http_request_duration_seconds', labels, duration)
+        registry.observe(
+            'starburger_db_queries_per_request', {'view': view}, timer.count,
+            buckets=QUERY_COUNT_BUCKETS,
+        )
+        registry.observe('starburger_db_query_duration_seconds', {'view': view}, timer.duration)
+        registry.start_dumper()
+
+
+def observe_geocoder_call(result, duration):
+    registry.inc('starburger_geocoder_requests_total', {'result': result})
+    registry.observe('starburger_geocoder_request_duration_seconds', {}, duration)
+
+
+def has_metrics_access(request):
+    """Сотрудник, запрос с токеном `METRICS_TOKEN` или с адреса
+    из `METRICS_ALLOWED_IPS`.
+
+    `INTERNAL_IPS` здесь не годится: за nginx все запросы приходят
+    с 127.0.0.1.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    if not has_metrics_access(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
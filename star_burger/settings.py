@@ -15,6 +15,24 @@ DEBUG = env.bool('DEBUG', False)
 ROLLBAR_TOKEN = env('ROLLBAR_TOKEN', default=None)
 DJANGO_ENV = env('DJANGO_ENV', 'production')
 YANDEX_API_KEY = env('YANDEX_API_KEY')
+YANDEX_GEOCODER_URL = env('YANDEX_GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODE_MAX_ATTEMPTS = env.int('GEOCODE_MAX_ATTEMPTS', 5)
+GEOCODE_RETRY_DELAY = env.int('GEOCODE_RETRY_DELAY', 60)
+GEOCODE_CACHE_SIZE = env.int('GEOCODE_CACHE_SIZE', 10000)
+GEOCODE_CACHE_TTL = env.int('GEOCODE_CACHE_TTL', 7 * 24 * 60 * 60)
+GEOCODE_CACHE_NEGATIVE_TTL = env.int('GEOCODE_CACHE_NEGATIVE_TTL', 60 * 60)
+GEOCODE_CACHE_ALIAS = env('GEOCODE_CACHE_ALIAS', None)
+DISTANCE_MODE = env('DISTANCE_MODE', 'haversine')
+MENU_INDEX_TTL = env.int('MENU_INDEX_TTL', 60)
+SPATIAL_INDEX_TTL = env.int('SPATIAL_INDEX_TTL', 60)
+SPATIAL_INDEX_CELL_KM = env.float('SPATIAL_INDEX_CELL_KM', 2)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = env.int('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+ORDERS_BOARD_POLL_INTERVAL = env.int('ORDERS_BOARD_POLL_INTERVAL', 5)
+ORDERS_BOARD_CURSOR_OVERLAP = env.int('ORDERS_BOARD_CURSOR_OVERLAP', 5)
+ORDERS_BOARD_DELETED_TTL = env.int('ORDERS_BOARD_DELETED_TTL', 24 * 60 * 60)
+SALES_ROLLUP_OVERLAP = env.int('SALES_ROLLUP_OVERLAP', 60)
+PRODUCTS_PAGE_SIZE = env.int('PRODUCTS_PAGE_SIZE', 50)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 
@@ -29,11 +47,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.template.defaultfilters',
-    'debug_toolbar',
     'rest_framework'
 ]
 
 MIDDLEWARE = [
+    'star_burger.log.RequestIdMiddleware',
+    'star_burger.metrics.MetricsMiddleware',
+    'star_burger.db_routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,10 +61,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'rollbar.contrib.django.middleware.RollbarNotifierMiddlewareExcluding404',
 ]
 
+if DEBUG:
+    # Панель отладки умеет только синхронный режим и под ASGI загнала бы
+    # все view в потоки, поэтому на проде её нет.
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(-1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+ORDER_API_ASYNC = env.bool('ORDER_API_ASYNC', False)
+
 ROOT_URLCONF = 'star_burger.urls'
 
 DEBUG_TOOLBAR_PANELS = [
@@ -85,14 +112,40 @@ WSGI_APPLICATION = 'star_burger.wsgi.application'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+THUMBNAIL_WIDTHS = sorted(env.list('THUMBNAIL_WIDTHS', [160, 320, 640], subcast=int))
+
 DATABASES = {
-    'default': env.dj_db_url('DB_URL', default='postgres://localhost'),
+    'default': env.dj_db_url(
+        'DB_URL',
+        default='postgres://localhost',
+        conn_max_age=env.int('DB_CONN_MAX_AGE', 0),
+    ),
     'TEST': {
         'CHARSET': 'utf8',
         'COLLATION': 'utf8_general_ci',
     }
 }
 
+REPLICA_DATABASE = None
+if env('REPLICA_DB_URL', None):
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = env.dj_db_url(
+        'REPLICA_DB_URL',
+        conn_max_age=env.int('REPLICA_CONN_MAX_AGE', 60),
+    )
+    DATABASES[REPLICA_DATABASE]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['star_burger.db_routers.ReplicaRouter']
+REPLICA_MAX_LAG = env.float('REPLICA_MAX_LAG', 5)
+REPLICA_CHECK_INTERVAL = env.float('REPLICA_CHECK_INTERVAL', 5)
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', 10)
+
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', default='locmem://'),
+}
+CATALOGUE_CACHE_TIMEOUT = env.int('CATALOGUE_CACHE_TIMEOUT', 5 * 60)
+PRODUCT_ROW_CACHE_TIMEOUT = env.int('PRODUCT_ROW_CACHE_TIMEOUT', 60 * 60)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -120,9 +173,42 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-INTERNAL_IPS = [
-    '127.0.0.1'
-]
+INTERNAL_IPS = env.list('INTERNAL_IPS', ['127.0.0.1'])
+
+LOG_FILE = env('LOG_FILE', os.path.join(BASE_DIR, 'logs', 'star_burger.log'))
+LOG_LEVEL = env('LOG_LEVEL', 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'star_burger.log.RequestIdFilter',
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'star_burger.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'file': {
+            '()': 'star_burger.log.QueueFileHandler',
+            'filename': LOG_FILE,
+            'formatter': 'json',
+            'filters': ['request_id'],
+        },
+    },
+    'root': {
+        'handlers': ['file'],
+        'level': LOG_LEVEL,
+    },
+}
+
+METRICS_DIR = env('METRICS_DIR', default=None)
+METRICS_DUMP_INTERVAL = env.float('METRICS_DUMP_INTERVAL', 5)
+METRICS_TOKEN = env('METRICS_TOKEN', default=None)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=[])
 
 
 STATICFILES_DIRS = [